@@ -5,39 +5,64 @@ Dedupes by (tweet_id, index). Writes a manifest for rename_and_organize.py.
 """
 from __future__ import annotations
 
-import json
+import contextlib
 import logging
+import os
+import re
+import shutil
 import sys
+import threading
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import jsonio
 
 logger = logging.getLogger(__name__)
 
 # Only allow downloads from known X/Twitter CDN hosts.
 ALLOWED_HOSTS = {"pbs.twimg.com", "ton.twimg.com", "video.twimg.com"}
 
+# Downloads are I/O-bound; run several in flight, but cap how many hit one host.
+DEFAULT_WORKERS = 16
+MAX_PER_HOST = 8
+
+
+# Fast path for plain http(s)://host/path URLs. The host may only contain
+# hostname characters, so anything with userinfo, a port or other oddities
+# fails to match and goes through urlparse instead.
+_URL_RE = re.compile(r"(https?)://([a-z0-9.-]+)(?=[/?#]|$)([^?#]*)", re.IGNORECASE)
+
+_EXTENSIONS = {"jpeg": "jpg", "jpg": "jpg", "png": "png", "gif": "gif", "webp": "webp"}
+
+
+def _split_url(url: str) -> tuple[str, str, str]:
+    """Return (scheme, hostname, path), lowercasing scheme and host like urlparse does."""
+    m = _URL_RE.match(url)
+    if m:
+        return m.group(1).lower(), m.group(2).lower(), m.group(3)
+    parsed = urlparse(url)
+    return parsed.scheme, parsed.hostname or "", parsed.path
+
 
 def _is_allowed_url(url: str) -> bool:
     """Return True if url points to a known X CDN host (rejects file://, private IPs, etc.)."""
-    parsed = urlparse(url)
-    if parsed.scheme not in ("http", "https"):
+    scheme, host, _ = _split_url(url)
+    if scheme not in ("http", "https"):
         return False
-    return parsed.hostname in ALLOWED_HOSTS
+    return host in ALLOWED_HOSTS
 
 
 def extension_from_url(url: str, default: str = "jpg") -> str:
     """Infer file extension from URL or Content-Type; default jpg."""
-    path = urlparse(url).path
-    if "." in path:
-        ext = path.rsplit(".", 1)[-1].lower()
-        if ext == "jpeg":
-            return "jpg"
-        if ext in ("jpg", "png", "gif", "webp"):
-            return ext
-    return default
+    path = _split_url(url)[2]
+    return _EXTENSIONS.get(path.rsplit(".", 1)[-1].lower(), default)
 
 
 def safe_filename_tweet_index(tweet_id: str, index: int, ext: str) -> str:
@@ -45,6 +70,17 @@ def safe_filename_tweet_index(tweet_id: str, index: int, ext: str) -> str:
     return f"{tweet_id}_{index}.{ext}"
 
 
+def _drop_page_cache(f) -> None:
+    """Hint the kernel that a freshly written file won't be re-read soon (no-op off Linux)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    f.flush()
+    try:
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+
 def download_one(
     url: str,
     dest_path: Path,
@@ -57,54 +93,66 @@ def download_one(
         return False
     sess = session or requests.Session()
     try:
-        r = sess.get(url, timeout=timeout, stream=True)
-        r.raise_for_status()
-        dest_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(dest_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=65536):
-                if chunk:
-                    f.write(chunk)
+        with sess.get(url, timeout=timeout, stream=True) as r:
+            r.raise_for_status()
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            # Let urllib3 undo any Content-Encoding, then copy in C with 1 MiB buffers.
+            r.raw.decode_content = True
+            with open(dest_path, "wb") as f:
+                shutil.copyfileobj(r.raw, f, length=1 << 20)
+                _drop_page_cache(f)
         return True
     except Exception as exc:
         logger.warning("Failed to download %s: %s", url, exc)
         return False
 
 
+def _build_session(pool_size: int) -> requests.Session:
+    """Session shared by all download threads, with a pool large enough for all of them."""
+    session = requests.Session()
+    session.headers.update({
+        "User-Agent": "Mozilla/5.0 (compatible; Twitter archive media downloader; +https://github.com)",
+    })
+    # Keep-alive comes from the pool; transient CDN errors and 429s are retried
+    # with backoff (honouring Retry-After) before download_one gives up.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=len(ALLOWED_HOSTS),
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 def download_all(
-    records: list[dict[str, Any]],
+    records: Iterable[dict[str, Any]],
     output_dir: Path,
     manifest_path: Path,
     skip_existing: bool = True,
     timeout: int = 30,
+    workers: int = DEFAULT_WORKERS,
 ) -> list[dict[str, Any]]:
     """
     Download all media from records into output_dir. Dedupes by (tweet_id, index).
     Appends to manifest_path a list of { tweet_id, index, path, username, date, text, like_source }.
+    Downloads run on a pool of `workers` threads sharing one session; manifest order
+    follows the input records regardless of completion order. records is consumed
+    in a single pass, so it may be a generator (see jsonio.iter_array).
     """
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
-    seen: set[tuple[str, int]] = set()
-    manifest_entries: list[dict[str, Any]] = []
-    session = requests.Session()
-    session.headers.update({
-        "User-Agent": "Mozilla/5.0 (compatible; Twitter archive media downloader; +https://github.com)",
-    })
-
-    # Pre-scan to count unique images (accounting for dedup).
-    total_images = 0
-    count_seen: set[tuple[str, int]] = set()
-    for rec in records:
-        tid = rec.get("tweet_id") or ""
-        urls = rec.get("media_urls") or []
-        if not tid or not urls:
-            continue
-        for idx in range(len(urls)):
-            k = (tid, idx)
-            if k not in count_seen:
-                count_seen.add(k)
-                total_images += 1
-    del count_seen
-    processed = 0
+    # Indices come from enumerate(), so the (tweet_id, index) pairs seen for a tweet
+    # are always 0..k-1: store k per tweet instead of one tuple per image.
+    seen: dict[str, int] = {}
+    # (entry, url, dest); url is None when the file already exists on disk.
+    work: list[tuple[dict[str, Any], str | None, Path]] = []
 
     for rec in records:
         tweet_id = rec.get("tweet_id") or ""
@@ -116,12 +164,13 @@ def download_all(
         if not tweet_id or not urls:
             continue
 
-        for index, url in enumerate(urls):
-            key = (tweet_id, index)
-            if key in seen:
-                continue
-            seen.add(key)
-            processed += 1
+        start = seen.get(tweet_id, 0)
+        if start >= len(urls):
+            continue
+        seen[tweet_id] = len(urls)
+
+        for index in range(start, len(urls)):
+            url = urls[index]
             ext = extension_from_url(url)
             name = safe_filename_tweet_index(tweet_id, index, ext)
             dest = output_dir / name
@@ -135,20 +184,46 @@ def download_all(
                 "like_source": like_source,
             }
             if skip_existing and dest.is_file():
-                manifest_entries.append(entry)
-                continue
-            if processed % 25 == 1 or processed == total_images:
-                print(f"  Downloading {processed}/{total_images}...", file=sys.stderr)
-            if download_one(url, dest, timeout=timeout, session=session):
-                manifest_entries.append(entry)
+                work.append((entry, None, dest))
+            else:
+                work.append((entry, url, dest))
+
+    to_fetch = [(i, url, dest) for i, (_, url, dest) in enumerate(work) if url is not None]
+    total = len(to_fetch)
+    ok = [url is None for _, url, _ in work]
+
+    if to_fetch:
+        workers = max(1, workers)
+        session = _build_session(pool_size=workers)
+        host_slots = {host: threading.BoundedSemaphore(MAX_PER_HOST) for host in ALLOWED_HOSTS}
+        progress_lock = threading.Lock()
+        processed = 0
+
+        def fetch(item: tuple[int, str, Path]) -> None:
+            nonlocal processed
+            i, url, dest = item
+            slot = host_slots.get(_split_url(url)[1])
+            if slot is None:
+                # download_one rejects disallowed hosts without touching the network
+                ok[i] = download_one(url, dest, timeout=timeout, session=session)
+            else:
+                with slot:
+                    ok[i] = download_one(url, dest, timeout=timeout, session=session)
+            with progress_lock:
+                processed += 1
+                if processed % 25 == 1 or processed == total:
+                    print(f"  Downloading {processed}/{total}...", file=sys.stderr)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() drains the iterator so worker exceptions surface here
+            list(pool.map(fetch, to_fetch))
+
+    manifest_entries = [entry for (entry, _, _), done in zip(work, ok) if done]
 
     if manifest_path:
         # Append or overwrite: for run.py we'll pass a single manifest and overwrite
         manifest_path.parent.mkdir(parents=True, exist_ok=True)
-        manifest_path.write_text(
-            json.dumps(manifest_entries, indent=2, ensure_ascii=False),
-            encoding="utf-8",
-        )
+        jsonio.write_json(manifest_path, manifest_entries)
     return manifest_entries
 
 
@@ -160,20 +235,24 @@ def main() -> None:
     parser.add_argument("-m", "--manifest", type=Path, default=Path("downloads/manifest.json"), help="Manifest JSON path")
     parser.add_argument("--no-skip-existing", action="store_true", help="Re-download even if file exists")
     parser.add_argument("--timeout", type=int, default=30, help="Request timeout seconds")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent downloads")
     args = parser.parse_args()
 
+    # Stream records straight from the input so a huge archive dump is never
+    # fully materialized before downloading starts.
     if args.input is None or (args.input == Path("-")):
-        records = json.load(sys.stdin)
+        src = contextlib.nullcontext(sys.stdin.buffer)
     else:
-        records = json.loads(args.input.read_text(encoding="utf-8"))
-
-    download_all(
-        records,
-        output_dir=args.output_dir,
-        manifest_path=args.manifest,
-        skip_existing=not args.no_skip_existing,
-        timeout=args.timeout,
-    )
+        src = open(args.input, "rb")
+    with src as f:
+        download_all(
+            jsonio.iter_array(f),
+            output_dir=args.output_dir,
+            manifest_path=args.manifest,
+            skip_existing=not args.no_skip_existing,
+            timeout=args.timeout,
+            workers=args.workers,
+        )
     print(f"Manifest written to {args.manifest}", file=sys.stderr)
 
 
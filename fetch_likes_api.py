@@ -4,16 +4,21 @@ Outputs the same record format as parse_archive.py for use with download_media a
 """
 from __future__ import annotations
 
-import json
+import functools
 import logging
 import os
+import sys
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
 import requests
 from requests_oauthlib import OAuth1
 
+import jsonio
+
 logger = logging.getLogger(__name__)
 
 API_BASE = "https://api.x.com/2"
@@ -63,6 +68,20 @@ def parse_api_tweet(
     }
 
 
+@functools.lru_cache(maxsize=4)
+def _parse_env_file(path: str) -> dict[str, str]:
+    """Parse KEY=value lines from an env file. Cached: sessions get rebuilt, .env doesn't change."""
+    values: dict[str, str] = {}
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith("#") and "=" in line:
+            k, _, v = line.partition("=")
+            k, v = k.strip(), v.strip().strip("'\"")
+            if k and v:
+                values.setdefault(k, v)
+    return values
+
+
 def _load_dotenv() -> None:
     """Load .env from current or script directory into os.environ.
     If TWITTER_ENV is set, load .env.<value> instead of .env (for alternate accounts).
@@ -72,13 +91,8 @@ def _load_dotenv() -> None:
     for d in (Path.cwd(), Path(__file__).resolve().parent):
         env_file = d / base
         if env_file.is_file():
-            for line in env_file.read_text().splitlines():
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    k, _, v = line.partition("=")
-                    k, v = k.strip(), v.strip().strip("'\"")
-                    if k and v:
-                        os.environ.setdefault(k, v)
+            for k, v in _parse_env_file(str(env_file)).items():
+                os.environ.setdefault(k, v)
             break
 
 
@@ -128,6 +142,35 @@ def get_me(session: requests.Session) -> str:
     return data["data"]["id"]
 
 
+def _rate_limit_wait(r: requests.Response, default: int = 60) -> int:
+    """Seconds to wait after a 429: Retry-After, else until x-rate-limit-reset, else default."""
+    if "Retry-After" in r.headers:
+        return int(r.headers["Retry-After"])
+    reset = r.headers.get("x-rate-limit-reset")
+    if reset and reset.isdigit():
+        return max(1, int(reset) - int(time.time()))
+    return default
+
+
+def _parse_liked_page(
+    data: dict[str, Any],
+    photos_only: bool,
+    like_source: str,
+) -> list[dict[str, Any]]:
+    """Turn one liked_tweets response page into records."""
+    tweets = data.get("data") or []
+    includes = data.get("includes") or {}
+    users_by_id = {u["id"]: u for u in (includes.get("users") or [])}
+    media_by_key = {m["media_key"]: m for m in (includes.get("media") or [])}
+
+    records: list[dict[str, Any]] = []
+    for t in tweets:
+        rec = parse_api_tweet(t, users_by_id, media_by_key, photos_only=photos_only, like_source=like_source)
+        if rec:
+            records.append(rec)
+    return records
+
+
 def fetch_liked_tweets(
     session: requests.Session,
     user_id: str,
@@ -138,6 +181,10 @@ def fetch_liked_tweets(
     """
     Paginate GET /2/users/:id/liked_tweets with media and user expansions.
     Return list of records: tweet_id, username, date, media_urls, text, like_source.
+
+    The cursor API is sequential, but each page is turned into records on a
+    worker thread while the next page is being fetched. Pacing is left to the
+    429 handling rather than a fixed sleep between pages.
     """
     params = {
         "max_results": min(max_results, 100),
@@ -146,52 +193,143 @@ def fetch_liked_tweets(
         "user.fields": "username",
         "media.fields": "url,type",
     }
-    records: list[dict[str, Any]] = []
+    pages: list[Future[list[dict[str, Any]]]] = []
     next_token: str | None = None
 
     max_retries = 5
-    while True:
-        if next_token:
-            params["pagination_token"] = next_token
-        # Retry loop for rate limits (don't spin forever on 429)
-        for _attempt in range(max_retries):
-            r = session.get(
-                f"{API_BASE}/users/{user_id}/liked_tweets",
-                params=params,
-                timeout=30,
-            )
-            if r.status_code == 429:
-                retry_after = int(r.headers.get("Retry-After", 60))
-                logger.warning("Rate limited on liked_tweets; sleeping %ds (attempt %d/%d)", retry_after, _attempt + 1, max_retries)
-                time.sleep(retry_after)
-                continue
-            break
-        r.raise_for_status()
-        data = r.json()
-
-        tweets = data.get("data") or []
-        includes = data.get("includes") or {}
-        users_by_id = {u["id"]: u for u in (includes.get("users") or [])}
-        media_by_key = {m["media_key"]: m for m in (includes.get("media") or [])}
+    with ThreadPoolExecutor(max_workers=1) as parser:
+        while True:
+            if next_token:
+                params["pagination_token"] = next_token
+            # Retry loop for rate limits (don't spin forever on 429)
+            for _attempt in range(max_retries):
+                r = session.get(
+                    f"{API_BASE}/users/{user_id}/liked_tweets",
+                    params=params,
+                    timeout=30,
+                )
+                if r.status_code == 429:
+                    retry_after = _rate_limit_wait(r)
+                    logger.warning("Rate limited on liked_tweets; sleeping %ds (attempt %d/%d)", retry_after, _attempt + 1, max_retries)
+                    time.sleep(retry_after)
+                    continue
+                break
+            r.raise_for_status()
+            data = r.json()
 
-        for t in tweets:
-            rec = parse_api_tweet(t, users_by_id, media_by_key, photos_only=photos_only, like_source=like_source_label)
-            if rec:
-                records.append(rec)
+            pages.append(parser.submit(_parse_liked_page, data, photos_only, like_source_label))
 
-        next_token = data.get("meta", {}).get("next_token")
-        if not next_token:
-            break
-        time.sleep(0.5)
+            next_token = data.get("meta", {}).get("next_token")
+            if not next_token:
+                break
 
+    records: list[dict[str, Any]] = []
+    for page in pages:
+        records.extend(page.result())
     return records
 
 
+# GET /2/tweets allows 300 requests per 15-minute window
+LOOKUP_RATE_LIMIT = 300
+LOOKUP_RATE_WINDOW = 15 * 60
+LOOKUP_WORKERS = 4
+
+
+class _TokenBucket:
+    """Thread-safe token bucket shared by lookup workers.
+
+    Starts full, so small jobs never wait; large ones settle at the API's
+    documented rate instead of running into 429s. pause() makes every caller
+    wait, e.g. after one worker sees a Retry-After.
+    """
+
+    def __init__(self, capacity: int, per_seconds: float) -> None:
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self._tokens = float(capacity)
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _lookup_batch(
+    session: requests.Session,
+    params: dict[str, str],
+    bucket: _TokenBucket,
+    stop: threading.Event,
+) -> dict[str, Any] | None:
+    """GET /2/tweets for one batch with retries. Returns the JSON body, or None.
+
+    Sets stop on 402/403 (out of credits / not permitted) so other workers
+    skip their remaining batches.
+    """
+    r = None
+    for _attempt in range(5):
+        if stop.is_set():
+            return None
+        bucket.acquire()
+        try:
+            r = session.get(f"{API_BASE}/tweets", params=params, timeout=30)
+        except requests.RequestException as exc:
+            print(f"  API request error: {exc}", file=sys.stderr, flush=True)
+            time.sleep(5)
+            continue
+
+        if r.status_code == 429:
+            retry_after = _rate_limit_wait(r)
+            print(
+                f"  API rate limited, waiting {retry_after}s "
+                f"(attempt {_attempt + 1}/5)...",
+                file=sys.stderr, flush=True,
+            )
+            bucket.pause(retry_after)
+            continue
+
+        if r.status_code in (402, 403):
+            if not stop.is_set():
+                stop.set()
+                print(
+                    f"  API returned {r.status_code} — stopping API lookup.",
+                    file=sys.stderr, flush=True,
+                )
+            return None
+
+        break
+
+    if r is None or r.status_code != 200:
+        status = r.status_code if r is not None else "no response"
+        print(
+            f"  API batch failed (status {status}), skipping batch.",
+            file=sys.stderr, flush=True,
+        )
+        return None
+    return r.json()
+
+
 def fetch_tweets_by_ids(
     session: requests.Session,
     tweet_ids: list[str],
     like_source_label: str = "api",
     photos_only: bool = True,
+    workers: int = LOOKUP_WORKERS,
 ) -> tuple[list[dict[str, Any]], set[str]]:
     """Batch-lookup tweets by ID via GET /2/tweets.
 
@@ -199,90 +337,68 @@ def fetch_tweets_by_ids(
     that were successfully looked up (even those without media), so the caller
     can determine which IDs still need gallery-dl fallback.
 
-    Handles 429 rate limits with retry. On 402/403 or persistent errors, stops
-    early and returns partial results.
+    Batches of 100 IDs are looked up by a few threads sharing the session,
+    paced by a token bucket at the endpoint's rate limit. Handles 429 rate
+    limits with retry. On 402/403 or persistent errors, stops early and
+    returns partial results. Records keep the order of tweet_ids' batches.
     """
-    import sys
-
     params_base = {
         "expansions": "attachments.media_keys,author_id",
         "tweet.fields": "created_at,author_id,attachments",
         "user.fields": "username",
         "media.fields": "url,type",
     }
-    records: list[dict[str, Any]] = []
-    resolved_ids: set[str] = set()
+    # Duplicates (same tweet liked from several sources) would each use quota
+    tweet_ids = list(dict.fromkeys(i for i in tweet_ids if i))
     total = len(tweet_ids)
-
-    for i in range(0, total, 100):
-        batch = tweet_ids[i : i + 100]
-        params = {**params_base, "ids": ",".join(batch)}
-
-        r = None
-        for _attempt in range(5):
-            try:
-                r = session.get(f"{API_BASE}/tweets", params=params, timeout=30)
-            except requests.RequestException as exc:
-                print(f"  API request error: {exc}", file=sys.stderr, flush=True)
-                time.sleep(5)
-                continue
-
-            if r.status_code == 429:
-                retry_after = int(r.headers.get("Retry-After", 60))
-                print(
-                    f"  API rate limited, waiting {retry_after}s "
-                    f"(attempt {_attempt + 1}/5)...",
-                    file=sys.stderr, flush=True,
-                )
-                time.sleep(retry_after)
-                continue
-
-            if r.status_code in (402, 403):
-                print(
-                    f"  API returned {r.status_code} — stopping API lookup. "
-                    f"Resolved {len(resolved_ids)}/{total} so far.",
-                    file=sys.stderr, flush=True,
-                )
-                return records, resolved_ids
-
-            break
-
-        if r is None or r.status_code != 200:
-            status = r.status_code if r else "no response"
-            print(
-                f"  API batch failed (status {status}), skipping batch.",
-                file=sys.stderr, flush=True,
-            )
-            continue
-
-        data = r.json()
+    batches = [tweet_ids[i : i + 100] for i in range(0, total, 100)]
+    bucket = _TokenBucket(LOOKUP_RATE_LIMIT, LOOKUP_RATE_WINDOW)
+    stop = threading.Event()
+    progress_lock = threading.Lock()
+    progress = {"looked_up": 0, "with_media": 0}
+
+    def run(batch: list[str]) -> tuple[list[dict[str, Any]], set[str]] | None:
+        data = _lookup_batch(session, {**params_base, "ids": ",".join(batch)}, bucket, stop)
+        if data is None:
+            return None
         tweets = data.get("data") or []
         includes = data.get("includes") or {}
         users_map = {u["id"]: u for u in (includes.get("users") or [])}
         media_map = {m["media_key"]: m for m in (includes.get("media") or [])}
 
+        batch_records: list[dict[str, Any]] = []
         for t in tweets:
-            tid = t.get("id") or ""
-            if tid:
-                resolved_ids.add(tid)
             rec = parse_api_tweet(
                 t, users_map, media_map,
                 photos_only=photos_only, like_source=like_source_label,
             )
             if rec:
-                records.append(rec)
-
-        # Also count IDs that were looked up but returned no data (deleted tweets etc.)
-        resolved_ids.update(batch)
-
-        processed = min(i + 100, total)
-        print(
-            f"  API: {processed}/{total} looked up, "
-            f"{len(records)} with media",
-            file=sys.stderr, flush=True,
-        )
-        time.sleep(0.25)
+                batch_records.append(rec)
+        # IDs that were looked up but returned no data (deleted tweets etc.)
+        # count as resolved too
+        batch_resolved = set(batch)
+        batch_resolved.update(t["id"] for t in tweets if t.get("id"))
+
+        with progress_lock:
+            progress["looked_up"] += len(batch)
+            progress["with_media"] += len(batch_records)
+            print(
+                f"  API: {progress['looked_up']}/{total} looked up, "
+                f"{progress['with_media']} with media",
+                file=sys.stderr, flush=True,
+            )
+        return batch_records, batch_resolved
 
+    records: list[dict[str, Any]] = []
+    resolved_ids: set[str] = set()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for result in pool.map(run, batches):
+            if result is not None:
+                records.extend(result[0])
+                resolved_ids.update(result[1])
+
+    if stop.is_set():
+        print(f"  Resolved {len(resolved_ids)}/{total} before stopping.", file=sys.stderr, flush=True)
     return records, resolved_ids
 
 
@@ -302,7 +418,7 @@ def fetch_likes(
     if output_path:
         p = Path(output_path)
         p.parent.mkdir(parents=True, exist_ok=True)
-        p.write_text(json.dumps(records, indent=2, ensure_ascii=False), encoding="utf-8")
+        jsonio.write_json(p, records)
     return records
 
 
@@ -335,7 +451,7 @@ def main() -> None:
         output_path=str(args.output) if args.output else None,
     )
     if not args.output:
-        print(json.dumps(records, indent=2, ensure_ascii=False))
+        sys.stdout.buffer.write(jsonio.dumps(records) + b"\n")
     else:
         print(f"Fetched {len(records)} tweets with media; wrote {args.output}", file=sys.stderr)
 
@@ -10,19 +10,37 @@ Train it with:  python filter_art.py --train labels.json
 """
 from __future__ import annotations
 
-import json
+import functools
+import hashlib
 import logging
+import os
+import sqlite3
 import sys
 from pathlib import Path
 from typing import Any
 
 import numpy as np
 
+import jsonio
+
 logger = logging.getLogger(__name__)
 
 CLASSIFIER_PATH = Path("art_classifier.pkl")
+EMBED_CACHE_PATH = Path("clip_embeddings.db")
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 
+CLIP_MODEL = "ViT-B-32"
+CLIP_PRETRAINED = "openai"
+EMBED_DIM = 512
+# Embeddings are unit-normalized, so FP16 loses nothing that matters for
+# scoring and halves memory and cache size. Cast to float32 before math.
+EMBED_DTYPE = np.float16
+# Images per encode_image call; large enough to keep a GPU busy, small
+# enough (~40 MB of input tensors) to be harmless on CPU.
+DEFAULT_BATCH_SIZE = 64
+# Background processes that decode/preprocess images while the model runs.
+LOADER_WORKERS = min(os.cpu_count() or 1, 8)
+
 DEFAULT_ART_PROMPT = "digital art, illustration, drawing, aesthetic artwork, painting"
 DEFAULT_NON_ART_PROMPT = (
     "screenshot, text message, meme with caption, UI interface, "
@@ -30,68 +48,290 @@ DEFAULT_NON_ART_PROMPT = (
 )
 
 
+@functools.lru_cache(maxsize=1)
 def _load_clip():
-    """Load CLIP ViT-B-32 model. Returns (model, preprocess, device)."""
+    """Load CLIP ViT-B-32 model. Returns (model, preprocess, device).
+
+    Cached for the life of the process, so train + filter (or repeated filter
+    calls from run.py) load and compile the weights once.
+    """
     import torch
     import open_clip
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
     model, _, preprocess = open_clip.create_model_and_transforms(
-        "ViT-B-32", pretrained="openai"
+        CLIP_MODEL, pretrained=CLIP_PRETRAINED
     )
     model = model.to(device).eval()
+    if device == "cuda":
+        # Only encode_image is hot; compiling the wrapper module wouldn't cover it
+        # since torch.compile only wraps forward().
+        eager = model.encode_image
+        model.encode_image = torch.compile(eager, mode="reduce-overhead")
+        # Compilation is lazy: warm up on a full-size dummy batch now so the
+        # compile cost is paid up front and a broken toolchain (e.g. no Triton)
+        # falls back to eager here instead of failing mid-run.
+        size = getattr(model.visual, "image_size", 224)
+        h, w = size if isinstance(size, (tuple, list)) else (size, size)
+        try:
+            with torch.inference_mode(), _autocast(device):
+                model.encode_image(torch.zeros(DEFAULT_BATCH_SIZE, 3, h, w, device=device))
+        except Exception as exc:
+            logger.warning("torch.compile failed, using eager CLIP: %s", exc)
+            model.encode_image = eager
     return model, preprocess, device
 
 
+def _autocast(device: str):
+    """FP16 autocast on CUDA (tensor cores); a no-op context on CPU."""
+    import torch
+
+    return torch.autocast(device_type="cuda", dtype=torch.float16, enabled=(device == "cuda"))
+
+
+# ---------------------------------------------------------------------------
+# Embedding cache
+# ---------------------------------------------------------------------------
+
+def _open_embed_cache(cache_path: Path) -> sqlite3.Connection:
+    """Open (creating if needed) the on-disk embedding cache."""
+    conn = sqlite3.connect(str(cache_path))
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS embeddings (
+               model   TEXT NOT NULL,
+               digest  BLOB NOT NULL,
+               emb     BLOB NOT NULL,
+               PRIMARY KEY (model, digest)
+           )"""
+    )
+    return conn
+
+
+def _file_digest(path: Path) -> bytes | None:
+    """SHA-1 of the file contents, or None if it can't be read."""
+    h = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except OSError as exc:
+        logger.warning("Failed to read %s: %s", path, exc)
+        return None
+    return h.digest()
+
+
+# Stored as emb for a file that failed to decode, so it isn't retried (and
+# CLIP isn't loaded for it) on every run. Keyed by content hash like any
+# entry, so a re-downloaded file gets a fresh attempt.
+_UNREADABLE_EMB = b""
+
+
+def _cache_lookup(
+    conn: sqlite3.Connection, model_id: str, digests: list[bytes]
+) -> dict[bytes, np.ndarray | None]:
+    """Fetch cached embeddings for the given digests (None: known unreadable)."""
+    found: dict[bytes, np.ndarray | None] = {}
+    unique = list(set(digests))
+    # Stay well under SQLite's bound-parameter limit
+    for i in range(0, len(unique), 500):
+        chunk = unique[i : i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT digest, emb FROM embeddings WHERE model = ? AND digest IN ({placeholders})",
+            (model_id, *chunk),
+        )
+        for digest, emb in rows:
+            if emb == _UNREADABLE_EMB:
+                found[digest] = None
+                continue
+            arr = np.frombuffer(emb, dtype=EMBED_DTYPE)
+            if arr.shape == (EMBED_DIM,):
+                found[digest] = arr
+    return found
+
+
+class _ImageDataset:
+    """Map-style dataset for torch's DataLoader: item i is (i, preprocessed tensor or None)."""
+
+    def __init__(self, paths: list[Path], preprocess):
+        self.paths = paths
+        self.preprocess = preprocess
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, i: int):
+        from PIL import Image
+
+        try:
+            img = Image.open(self.paths[i]).convert("RGB")
+            return i, self.preprocess(img)
+        except Exception as exc:
+            logger.warning("Failed to open %s: %s", self.paths[i], exc)
+            return i, None
+
+
+def _collate_images(batch):
+    """Stack the images that opened; returns (positions, tensor or None)."""
+    import torch
+
+    ok = [(i, t) for i, t in batch if t is not None]
+    if not ok:
+        return [], None
+    return [i for i, _ in ok], torch.stack([t for _, t in ok])
+
+
+def _prefetch_to_device(loader, device: str):
+    """Yield (positions, batch) from loader with batch already on device.
+
+    On CUDA the copy of batch k+1 is issued on a side stream while batch k is
+    being encoded, so host-to-device transfer hides behind compute.
+    """
+    import torch
+
+    if device != "cuda":
+        for positions, batch in loader:
+            yield positions, (batch.to(device) if batch is not None else None)
+        return
+
+    copy_stream = torch.cuda.Stream()
+
+    def stage(item):
+        positions, batch = item
+        if batch is not None:
+            with torch.cuda.stream(copy_stream):
+                batch = batch.to(device, non_blocking=True)
+        return positions, batch
+
+    it = iter(loader)
+    item = next(it, None)
+    ready = stage(item) if item is not None else None
+    while ready is not None:
+        compute_stream = torch.cuda.current_stream()
+        compute_stream.wait_stream(copy_stream)
+        if ready[1] is not None:
+            # Allocated on copy_stream but consumed on compute_stream
+            ready[1].record_stream(compute_stream)
+        current = ready
+        item = next(it, None)
+        ready = stage(item) if item is not None else None
+        yield current
+
+
 def _extract_embeddings(
     image_paths: list[Path],
-    model,
-    preprocess,
-    device: str,
-    batch_size: int = 16,
-) -> np.ndarray:
-    """Extract normalized CLIP embeddings for a list of images. Returns (N, 512) array."""
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    cache_path: Path | None = EMBED_CACHE_PATH,
+    num_workers: int = LOADER_WORKERS,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Extract normalized CLIP embeddings for a list of images.
+
+    Returns (embeddings, valid): an (N, 512) FP16 array and an (N,) bool mask
+    that is False for images that failed to open (their rows are zero and
+    should not be scored or trained on).
+
+    Embeddings are cached in cache_path keyed by the image's content hash, so
+    only new or changed images go through the model, and CLIP isn't loaded at
+    all when every image is cached. Pass cache_path=None to disable the cache.
+
+    Decoding and preprocessing run in num_workers DataLoader processes so the
+    next batch is prepared while the model encodes the current one.
+    """
     import torch
-    from PIL import Image
+    from torch.utils.data import DataLoader
 
-    all_features = []
     total = len(image_paths)
+    out = np.zeros((total, EMBED_DIM), dtype=EMBED_DTYPE)
+    have = np.zeros(total, dtype=bool)
+    model_id = f"{CLIP_MODEL}/{CLIP_PRETRAINED}"
+
+    conn = None
+    digests: list[bytes | None] = [None] * total
+    # Cached as unreadable: stays invalid without another decode attempt
+    known_bad = np.zeros(total, dtype=bool)
+    if cache_path is not None:
+        conn = _open_embed_cache(cache_path)
+        digests = [_file_digest(p) for p in image_paths]
+        cached = _cache_lookup(conn, model_id, [d for d in digests if d is not None])
+        for i, d in enumerate(digests):
+            if d is not None and d in cached:
+                emb = cached[d]
+                if emb is None:
+                    known_bad[i] = True
+                else:
+                    out[i] = emb
+                    have[i] = True
+
+    todo = np.flatnonzero(~(have | known_bad)).tolist()
+    if conn is not None:
+        print(
+            f"  Embeddings: {total - len(todo)}/{total} cached"
+            f" ({int(known_bad.sum())} unreadable), computing {len(todo)}",
+            file=sys.stderr,
+        )
 
-    for batch_start in range(0, total, batch_size):
-        batch_paths = image_paths[batch_start : batch_start + batch_size]
-        tensors = []
-        for p in batch_paths:
-            try:
-                img = Image.open(p).convert("RGB")
-                tensors.append(preprocess(img))
-            except Exception as exc:
-                logger.warning("Failed to open %s: %s", p, exc)
-                tensors.append(None)
-
-        valid = [t for t in tensors if t is not None]
-        if not valid:
-            all_features.extend([np.zeros(512)] * len(batch_paths))
-            continue
-
-        batch_tensor = torch.stack(valid).to(device)
-        with torch.no_grad():
-            features = model.encode_image(batch_tensor).float()
-            features /= features.norm(dim=-1, keepdim=True)
-
-        feat_np = features.cpu().numpy()
-        feat_idx = 0
-        for t in tensors:
-            if t is not None:
-                all_features.append(feat_np[feat_idx])
-                feat_idx += 1
-            else:
-                all_features.append(np.zeros(512))
+    if not todo:
+        if conn is not None:
+            conn.close()
+        return out, have
 
-        processed = min(batch_start + batch_size, total)
-        if processed % (batch_size * 4) < batch_size or processed == total:
-            print(f"  Embeddings: {processed}/{total}", file=sys.stderr)
+    model, preprocess, device = _load_clip()
+    # No point forking more workers than there are batches
+    workers = min(num_workers, -(-len(todo) // batch_size))
+    loader = DataLoader(
+        _ImageDataset([image_paths[i] for i in todo], preprocess),
+        batch_size=batch_size,
+        num_workers=workers,
+        collate_fn=_collate_images,
+        pin_memory=(device == "cuda"),
+        **({"prefetch_factor": 4} if workers else {}),
+    )
 
-    return np.array(all_features)
+    try:
+        for batch_num, (positions, batch_tensor) in enumerate(_prefetch_to_device(loader, device)):
+            if conn is not None:
+                # The loader doesn't shuffle: batch k is todo[k*batch_size:...];
+                # positions lists only the images in it that opened
+                start = batch_num * batch_size
+                failed = set(range(start, min(start + batch_size, len(todo)))) - set(positions)
+                bad_rows = [(model_id, digests[todo[pos]], _UNREADABLE_EMB) for pos in sorted(failed)]
+                bad_rows = [row for row in bad_rows if row[1] is not None]
+                if bad_rows:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (model, digest, emb) VALUES (?, ?, ?)",
+                        bad_rows,
+                    )
+                    conn.commit()
+            if batch_tensor is not None:
+                ok_idx = [todo[pos] for pos in positions]
+                with torch.inference_mode():
+                    with _autocast(device):
+                        features = model.encode_image(batch_tensor)
+                    # Normalize in FP32 regardless of the autocast dtype
+                    features = features.float()
+                    features /= features.norm(dim=-1, keepdim=True)
+                    feat_np = features.half().cpu().numpy()
+                out[ok_idx] = feat_np
+                have[ok_idx] = True
+                if conn is not None:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (model, digest, emb) VALUES (?, ?, ?)",
+                        [
+                            (model_id, digests[i], feat.tobytes())
+                            for i, feat in zip(ok_idx, feat_np)
+                            if digests[i] is not None
+                        ],
+                    )
+                    conn.commit()
+
+            processed = min((batch_num + 1) * batch_size, len(todo))
+            if processed % (batch_size * 4) < batch_size or processed == len(todo):
+                print(f"  Embeddings: {processed}/{len(todo)}", file=sys.stderr)
+    finally:
+        if conn is not None:
+            conn.close()
+
+    return out, have
 
 
 # ---------------------------------------------------------------------------
@@ -101,7 +341,8 @@ def _extract_embeddings(
 def train_classifier(
     labels_path: Path,
     classifier_path: Path = CLASSIFIER_PATH,
-    batch_size: int = 16,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    embed_cache_path: Path | None = EMBED_CACHE_PATH,
 ) -> Path:
     """
     Train a logistic regression on CLIP embeddings using labels from label_images.py.
@@ -112,7 +353,7 @@ def train_classifier(
     import joblib
 
     labels_path = Path(labels_path)
-    labels: dict[str, bool] = json.loads(labels_path.read_text(encoding="utf-8"))
+    labels: dict[str, bool] = jsonio.read_json(labels_path)
     if not labels:
         print("Error: labels file is empty.", file=sys.stderr)
         sys.exit(1)
@@ -132,13 +373,16 @@ def train_classifier(
         print(f"Error: need at least 4 labeled images, got {len(paths)}.", file=sys.stderr)
         sys.exit(1)
 
-    keep_count = sum(targets)
-    skip_count = len(targets) - keep_count
-    print(f"Training on {len(paths)} images ({keep_count} keep, {skip_count} skip)...", file=sys.stderr)
+    X, valid = _extract_embeddings(paths, batch_size=batch_size, cache_path=embed_cache_path)
+    X = X[valid].astype(np.float32)
+    y = np.array(targets)[valid]
+    if len(y) < 4:
+        print(f"Error: need at least 4 readable labeled images, got {len(y)}.", file=sys.stderr)
+        sys.exit(1)
 
-    model, preprocess, device = _load_clip()
-    X = _extract_embeddings(paths, model, preprocess, device, batch_size=batch_size)
-    y = np.array(targets)
+    keep_count = int(y.sum())
+    skip_count = len(y) - keep_count
+    print(f"Training on {len(y)} images ({keep_count} keep, {skip_count} skip)...", file=sys.stderr)
 
     clf = LogisticRegression(class_weight="balanced", max_iter=1000)
 
@@ -162,23 +406,40 @@ def _resolve_manifest_images(
     manifest_path: Path,
     download_dir: Path,
 ) -> list[tuple[dict[str, Any], Path]]:
-    """Validate manifest entries and return (entry, path) pairs for real files."""
+    """Validate manifest entries and return (entry, path) pairs for real files.
+
+    Lists download_dir once and matches entries by filename, so the common
+    case costs no per-entry stat/resolve. Entries that point elsewhere (or at
+    symlinks) fall back to a full containment check.
+    """
     download_dir = Path(download_dir)
     resolved_download = download_dir.resolve()
-    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
     valid: list[tuple[dict[str, Any], Path]] = []
 
-    for entry in manifest:
-        raw = entry.get("path") or ""
-        path = Path(raw)
-        if not path.is_file() and not path.is_absolute():
-            path = download_dir / path.name
-        if not path.is_file():
-            continue
-        if not path.resolve().is_relative_to(resolved_download):
-            logger.warning("Skipping file outside download dir: %s", path)
-            continue
-        valid.append((entry, path))
+    existing: dict[str, Path] = {}
+    if download_dir.is_dir():
+        with os.scandir(download_dir) as it:
+            # Regular files only: a symlink could point outside download_dir
+            existing = {e.name: Path(e.path) for e in it if e.is_file(follow_symlinks=False)}
+
+    home = (download_dir, resolved_download, Path("."))
+    # Stream the manifest: only entries with a real file are kept in memory
+    with Path(manifest_path).open("rb") as f:
+        for entry in jsonio.iter_array(f):
+            raw = entry.get("path") or ""
+            path = Path(raw)
+            local = existing.get(path.name)
+            if local is not None and path.parent in home:
+                valid.append((entry, local))
+                continue
+            if not path.is_file() and not path.is_absolute():
+                path = download_dir / path.name
+            if not path.is_file():
+                continue
+            if not path.resolve().is_relative_to(resolved_download):
+                logger.warning("Skipping file outside download dir: %s", path)
+                continue
+            valid.append((entry, path))
 
     return valid
 
@@ -188,21 +449,20 @@ def _filter_with_classifier(
     classifier_path: Path,
     threshold: float,
     batch_size: int,
+    embed_cache_path: Path | None,
 ) -> list[dict[str, Any]]:
     """Score images with the trained classifier."""
     import joblib
 
     clf = joblib.load(classifier_path)
     paths = [p for _, p in valid_entries]
-    model, preprocess, device = _load_clip()
-    X = _extract_embeddings(paths, model, preprocess, device, batch_size=batch_size)
-    probs = clf.predict_proba(X)[:, 1]
+    X, valid = _extract_embeddings(paths, batch_size=batch_size, cache_path=embed_cache_path)
+    rows = np.flatnonzero(valid)
+    if not len(rows):
+        return []
+    probs = clf.predict_proba(X[rows].astype(np.float32))[:, 1]
 
-    kept = []
-    for i, (entry, _) in enumerate(valid_entries):
-        if probs[i] >= threshold:
-            kept.append(entry)
-    return kept
+    return [valid_entries[i][0] for i, p in zip(rows, probs) if p >= threshold]
 
 
 def _filter_zero_shot(
@@ -211,59 +471,32 @@ def _filter_zero_shot(
     non_art_prompt: str,
     threshold: float,
     batch_size: int,
+    embed_cache_path: Path | None,
 ) -> list[dict[str, Any]]:
     """Score images with zero-shot CLIP contrastive scoring."""
     import torch
     import open_clip
 
     model, preprocess, device = _load_clip()
-    tokenizer = open_clip.get_tokenizer("ViT-B-32")
+    tokenizer = open_clip.get_tokenizer(CLIP_MODEL)
 
     text_tokens = tokenizer([art_prompt, non_art_prompt]).to(device)
-    with torch.no_grad():
-        text_features = model.encode_text(text_tokens).float()
+    with torch.inference_mode():
+        with _autocast(device):
+            text_features = model.encode_text(text_tokens)
+        text_features = text_features.float()
         text_features /= text_features.norm(dim=-1, keepdim=True)
-    art_feat = text_features[0:1]
-    non_art_feat = text_features[1:2]
+        text_np = text_features.cpu().numpy()
+    # x·art - x·non_art == x·(art - non_art): one product per image instead of two
+    diff_feat = text_np[0] - text_np[1]
 
     paths = [p for _, p in valid_entries]
-    model_clip, preprocess_clip, device_clip = model, preprocess, device
-
-    kept = []
-    from PIL import Image
-
-    for batch_start in range(0, len(valid_entries), batch_size):
-        batch_items = valid_entries[batch_start : batch_start + batch_size]
-        tensors = []
-        batch_entries = []
-        for entry, path in batch_items:
-            try:
-                img = Image.open(path).convert("RGB")
-                tensors.append(preprocess_clip(img))
-                batch_entries.append(entry)
-            except Exception as exc:
-                logger.warning("Failed to open image %s: %s", path, exc)
-
-        if not tensors:
-            continue
-
-        batch_tensor = torch.stack(tensors).to(device_clip)
-        with torch.no_grad():
-            image_features = model_clip.encode_image(batch_tensor).float()
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            art_scores = (image_features @ art_feat.T).squeeze(-1)
-            non_art_scores = (image_features @ non_art_feat.T).squeeze(-1)
-            delta_scores = art_scores - non_art_scores
-
-        for i, entry in enumerate(batch_entries):
-            if delta_scores[i].item() >= threshold:
-                kept.append(entry)
-
-        processed = min(batch_start + batch_size, len(valid_entries))
-        if processed % (batch_size * 4) < batch_size or processed == len(valid_entries):
-            print(f"  Art filter: {processed}/{len(valid_entries)} scored, {len(kept)} kept so far...", file=sys.stderr)
+    X, valid = _extract_embeddings(paths, batch_size=batch_size, cache_path=embed_cache_path)
+    rows = np.flatnonzero(valid)
+    X = X[rows].astype(np.float32)
+    delta_scores = X @ diff_feat
 
-    return kept
+    return [valid_entries[i][0] for i, d in zip(rows, delta_scores) if d >= threshold]
 
 
 def filter_art_from_manifest(
@@ -273,8 +506,9 @@ def filter_art_from_manifest(
     threshold: float | None = None,
     art_prompt: str = DEFAULT_ART_PROMPT,
     non_art_prompt: str = DEFAULT_NON_ART_PROMPT,
-    batch_size: int = 16,
+    batch_size: int = DEFAULT_BATCH_SIZE,
     classifier_path: Path = CLASSIFIER_PATH,
+    embed_cache_path: Path | None = EMBED_CACHE_PATH,
 ) -> Path | None:
     """
     Filter manifest to art-like images. Uses trained classifier if available,
@@ -306,19 +540,18 @@ def filter_art_from_manifest(
         default_threshold = 0.5
         t = threshold if threshold is not None else default_threshold
         print(f"  Art filter: scoring {total} images with trained classifier (threshold={t})...", file=sys.stderr)
-        kept = _filter_with_classifier(valid_entries, classifier_path, t, batch_size)
+        kept = _filter_with_classifier(valid_entries, classifier_path, t, batch_size, embed_cache_path)
     else:
         default_threshold = 0.03
         t = threshold if threshold is not None else default_threshold
         print(f"  Art filter: scoring {total} images with zero-shot CLIP (threshold={t})...", file=sys.stderr)
-        kept = _filter_zero_shot(valid_entries, art_prompt, non_art_prompt, t, batch_size)
+        kept = _filter_zero_shot(
+            valid_entries, art_prompt, non_art_prompt, t, batch_size, embed_cache_path,
+        )
 
     print(f"  Art filter: kept {len(kept)}/{total} images.", file=sys.stderr)
 
-    output_manifest_path.write_text(
-        json.dumps(kept, indent=2, ensure_ascii=False),
-        encoding="utf-8",
-    )
+    jsonio.write_json(output_manifest_path, kept)
     return output_manifest_path
 
 
@@ -332,11 +565,16 @@ def main() -> None:
     # -- train --
     train_p = sub.add_parser("train", help="Train classifier from labels.json")
     train_p.add_argument("labels", type=Path, help="labels.json from label_images.py")
-    train_p.add_argument("--batch-size", type=int, default=16)
+    train_p.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
     train_p.add_argument(
         "--classifier", type=Path, default=CLASSIFIER_PATH,
         help=f"Output path for classifier (default: {CLASSIFIER_PATH})",
     )
+    train_p.add_argument(
+        "--embed-cache", type=Path, default=EMBED_CACHE_PATH,
+        help=f"CLIP embedding cache (default: {EMBED_CACHE_PATH})",
+    )
+    train_p.add_argument("--no-embed-cache", action="store_true", help="Don't read or write the embedding cache")
 
     # -- filter --
     filter_p = sub.add_parser("filter", help="Filter a manifest to art-like images")
@@ -344,12 +582,23 @@ def main() -> None:
     filter_p.add_argument("--download-dir", type=Path, default=Path("downloads"))
     filter_p.add_argument("-o", "--output", type=Path, default=None)
     filter_p.add_argument("--threshold", type=float, default=None)
-    filter_p.add_argument("--batch-size", type=int, default=16)
+    filter_p.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    filter_p.add_argument(
+        "--embed-cache", type=Path, default=EMBED_CACHE_PATH,
+        help=f"CLIP embedding cache (default: {EMBED_CACHE_PATH})",
+    )
+    filter_p.add_argument("--no-embed-cache", action="store_true", help="Don't read or write the embedding cache")
 
     args = parser.parse_args()
+    embed_cache = None if getattr(args, "no_embed_cache", False) else getattr(args, "embed_cache", None)
 
     if args.command == "train":
-        train_classifier(args.labels, classifier_path=args.classifier, batch_size=args.batch_size)
+        train_classifier(
+            args.labels,
+            classifier_path=args.classifier,
+            batch_size=args.batch_size,
+            embed_cache_path=embed_cache,
+        )
     elif args.command == "filter":
         out = filter_art_from_manifest(
             args.manifest,
@@ -357,8 +606,9 @@ def main() -> None:
             output_manifest_path=args.output,
             threshold=args.threshold,
             batch_size=args.batch_size,
+            embed_cache_path=embed_cache,
         )
-        kept_count = len(json.loads(out.read_text(encoding="utf-8")))
+        kept_count = len(jsonio.read_json(out))
         print(f"Kept {kept_count} images; manifest at {out}", file=sys.stderr)
     else:
         parser.print_help()
@@ -0,0 +1,116 @@
+"""
+JSON helpers shared by the pipeline scripts. Uses orjson when installed
+(much faster for large manifests) and falls back to the stdlib json module.
+Output matches json.dumps(..., indent=2, ensure_ascii=False) either way.
+Large top-level arrays can be streamed with ijson when it is installed.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def dumps(obj: Any, indent: bool = True) -> bytes:
+    """Serialize obj as UTF-8 JSON bytes, indented unless indent=False."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    """Parse JSON from bytes or str. Raises json.JSONDecodeError on bad input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_json(path: Path) -> Any:
+    """Read and parse a JSON file."""
+    return loads(Path(path).read_bytes())
+
+
+def write_json(path: Path, obj: Any) -> None:
+    """Write obj to path as indented UTF-8 JSON."""
+    Path(path).write_bytes(dumps(obj))
+
+
+class ObjectWriter:
+    """Write a top-level JSON object to path one member at a time.
+
+    Output is byte-identical to write_json() of the equivalent dict, without
+    holding the dict or its serialization in memory. Members go to a .tmp
+    file that replaces path on a clean exit; if nothing was written or an
+    exception escapes, path is left untouched.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self.count = 0
+
+    def __enter__(self) -> ObjectWriter:
+        self._f = self._tmp.open("wb")
+        return self
+
+    def write(self, key: str, value: Any) -> None:
+        # Re-indent the nested value one level; raw newlines in JSON output
+        # are always formatting (newlines inside strings are escaped)
+        self._f.write(
+            (b",\n  " if self.count else b"{\n  ")
+            + dumps(key) + b": " + dumps(value).replace(b"\n", b"\n  ")
+        )
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        ok = exc_type is None and self.count > 0
+        if ok:
+            self._f.write(b"\n}")
+        self._f.close()
+        if ok:
+            os.replace(self._tmp, self.path)
+        else:
+            self._tmp.unlink(missing_ok=True)
+
+
+def iter_array(f: BinaryIO) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array read from a binary file.
+
+    With ijson the document is parsed incrementally, so only one element is
+    in memory at a time; without it the whole array is parsed up front.
+    A top-level value that is not an array, and malformed input, raise
+    json.JSONDecodeError in both cases (the latter possibly after some
+    elements have already been yielded).
+    """
+    if ijson is not None:
+        try:
+            # use_float: plain floats rather than Decimal, so results stay orjson-serializable
+            events = ijson.parse(f, use_float=True)
+            first = next(events, None)
+            if first is None or first[1] != "start_array":
+                raise json.JSONDecodeError("top-level JSON value is not an array", "", 0)
+            yield from ijson.items(itertools.chain((first,), events), "item")
+        except ijson.JSONError as exc:
+            # The C backend reports multi-line (sometimes bytes) messages
+            msg = exc.args[0] if exc.args else "invalid JSON"
+            if isinstance(msg, bytes):
+                msg = msg.decode("utf-8", errors="replace")
+            raise json.JSONDecodeError(str(msg).strip().splitlines()[0], "", 0) from exc
+    else:
+        data = loads(f.read())
+        if not isinstance(data, list):
+            raise json.JSONDecodeError("top-level JSON value is not an array", "", 0)
+        yield from data
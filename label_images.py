@@ -12,31 +12,58 @@ from __future__ import annotations
 
 import argparse
 import json
-import mimetypes
+import os
 import sys
+import threading
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 from urllib.parse import unquote
 
+import jsonio
+
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+MIME_BY_EXT = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
 DEFAULT_PORT = 8421
+# Grid thumbnails (the grid shows 180px cards); cached in <directory>/.thumbs
+THUMB_SIZE = 256
+THUMB_DIR_NAME = ".thumbs"
 
 
 def discover_images(directory: Path) -> list[str]:
-    """Return sorted list of image filenames in directory."""
+    """Return sorted list of image filenames in directory.
+
+    Symlinks are included only if they resolve inside directory, so every
+    returned name is safe to serve as-is.
+    """
+    root = directory.resolve()
     names = []
-    for p in sorted(directory.iterdir()):
-        if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS:
-            names.append(p.name)
+    with os.scandir(directory) as it:
+        for e in it:
+            if os.path.splitext(e.name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            if e.is_symlink():
+                if not e.is_file() or not Path(e.path).resolve().is_relative_to(root):
+                    continue
+            elif not e.is_file(follow_symlinks=False):
+                continue
+            names.append(e.name)
+    names.sort()
     return names
 
 
 def load_labels(path: Path) -> dict[str, bool]:
     if path.is_file():
         try:
-            return json.loads(path.read_text(encoding="utf-8"))
+            return jsonio.read_json(path)
         except (json.JSONDecodeError, OSError):
             pass
     return {}
@@ -142,7 +169,7 @@ function renderGrid() {
 
     const img = document.createElement("img");
     img.loading = "lazy";
-    img.src = "/images/" + encodeURIComponent(name);
+    img.src = "/thumbs/" + encodeURIComponent(name);
     img.alt = name;
     card.appendChild(img);
 
@@ -280,13 +307,22 @@ class LabelHandler(BaseHTTPRequestHandler):
     image_dir: Path
     labels_path: Path
     image_names: list[str]
+    # Allowlist for /images/: only names found by discover_images are served
+    image_name_set: frozenset[str]
+    # Grid thumbnails, stored as <thumbs_dir>/<name>.jpg for names in thumb_names
+    thumbs_dir: Path
+    thumb_names: frozenset[str] = frozenset()
+    # In-memory copy of labels.json, loaded at startup and replaced on POST
+    labels: dict[str, bool]
+    # Requests are handled on separate threads; serialize labels.json writes
+    labels_lock = threading.Lock()
 
     def log_message(self, fmt: str, *args: object) -> None:
         # Quiet request logging; only log errors
         pass
 
     def _send_json(self, data: object, status: int = 200) -> None:
-        body = json.dumps(data, ensure_ascii=False).encode()
+        body = jsonio.dumps(data, indent=False)
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(body)))
@@ -313,31 +349,61 @@ class LabelHandler(BaseHTTPRequestHandler):
             return
 
         if path == "/api/labels":
-            self._send_json(load_labels(self.labels_path))
+            self._send_json(self.labels)
             return
 
         if path.startswith("/images/"):
             filename = path[len("/images/"):]
-            file_path = self.image_dir / filename
-            resolved = file_path.resolve()
-            if not resolved.is_relative_to(self.image_dir.resolve()):
-                self.send_error(HTTPStatus.FORBIDDEN)
+            # Membership also rules out traversal: names never contain "/"
+            if filename not in self.image_name_set:
+                self.send_error(HTTPStatus.NOT_FOUND)
                 return
-            if not file_path.is_file():
+            self._send_file(self.image_dir / filename)
+            return
+
+        if path.startswith("/thumbs/"):
+            filename = path[len("/thumbs/"):]
+            if filename not in self.image_name_set:
                 self.send_error(HTTPStatus.NOT_FOUND)
                 return
-            mime, _ = mimetypes.guess_type(file_path.name)
-            data = file_path.read_bytes()
-            self.send_response(200)
-            self.send_header("Content-Type", mime or "application/octet-stream")
-            self.send_header("Content-Length", str(len(data)))
-            self.send_header("Cache-Control", "public, max-age=86400")
-            self.end_headers()
-            self.wfile.write(data)
+            if filename in self.thumb_names:
+                self._send_file(self.thumbs_dir / (filename + ".jpg"))
+            else:
+                # No thumbnail (Pillow missing or unreadable image): send the original
+                self._send_file(self.image_dir / filename)
             return
 
         self.send_error(HTTPStatus.NOT_FOUND)
 
+    def _send_file(self, file_path: Path) -> None:
+        """Send a file with an ETag, or 304 if the client's copy is current."""
+        mime = MIME_BY_EXT.get(file_path.suffix.lower(), "application/octet-stream")
+        try:
+            f = file_path.open("rb")
+        except OSError:
+            # Deleted since startup
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+            if_none_match = self.headers.get("If-None-Match", "")
+            if etag in (t.strip() for t in if_none_match.split(",")):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "public, max-age=86400")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", mime)
+            self.send_header("Content-Length", str(size))
+            self.send_header("Cache-Control", "public, max-age=86400")
+            self.send_header("ETag", etag)
+            self.end_headers()
+            # Zero-copy where the OS supports it; socket.sendfile falls back to send()
+            self.connection.sendfile(f, 0, size)
+
     def do_POST(self) -> None:
         path = unquote(self.path)
 
@@ -345,7 +411,7 @@ class LabelHandler(BaseHTTPRequestHandler):
             length = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(length)
             try:
-                data = json.loads(body)
+                data = jsonio.loads(body)
             except json.JSONDecodeError:
                 self.send_error(HTTPStatus.BAD_REQUEST, "Invalid JSON")
                 return
@@ -354,21 +420,77 @@ class LabelHandler(BaseHTTPRequestHandler):
                 return
             # Only keep labels for images that actually exist
             clean: dict[str, bool] = {}
-            valid = set(self.image_names)
             for k, v in data.items():
-                if k in valid and isinstance(v, bool):
+                if k in self.image_name_set and isinstance(v, bool):
                     clean[k] = v
-            self.labels_path.write_text(
-                json.dumps(clean, indent=2, ensure_ascii=False),
-                encoding="utf-8",
-            )
+            with self.labels_lock:
+                # Write then rename so a crash never leaves a truncated labels.json
+                tmp = self.labels_path.with_name(self.labels_path.name + ".tmp")
+                tmp.write_bytes(jsonio.dumps(clean))
+                os.replace(tmp, self.labels_path)
+                type(self).labels = clean
             self._send_json({"ok": True, "count": len(clean)})
             return
 
         self.send_error(HTTPStatus.NOT_FOUND)
 
 
-def run_server(image_dir: Path, labels_path: Path, port: int = DEFAULT_PORT) -> None:
+def _make_thumbnail(src: Path, dest: Path) -> bool:
+    """Write a THUMB_SIZE JPEG of src to dest unless an up-to-date one exists."""
+    from PIL import Image
+
+    try:
+        if dest.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+            return True
+    except FileNotFoundError:
+        pass
+    try:
+        with Image.open(src) as img:
+            img.draft("RGB", (THUMB_SIZE, THUMB_SIZE))  # fast JPEG downscale on decode
+            img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+            tmp = dest.with_name(dest.name + ".tmp")
+            img.convert("RGB").save(tmp, "JPEG", quality=82)
+        os.replace(tmp, dest)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def build_thumbnails(image_dir: Path, names: list[str], thumbs_dir: Path) -> frozenset[str]:
+    """Generate grid thumbnails in thumbs_dir; return the names that have one.
+
+    Existing thumbnails newer than their source are reused. Returns an empty
+    set (grid falls back to originals) when Pillow is not installed.
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("Pillow not installed; serving full-size images to the grid", file=sys.stderr)
+        return frozenset()
+
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+    done: set[str] = set()
+    total = len(names)
+    # PIL releases the GIL while decoding/encoding, so threads scale
+    with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, 8)) as pool:
+        results = pool.map(
+            lambda n: _make_thumbnail(image_dir / n, thumbs_dir / (n + ".jpg")), names,
+        )
+        for i, (name, ok) in enumerate(zip(names, results), 1):
+            if ok:
+                done.add(name)
+            if i % 200 == 0 or i == total:
+                print(f"  Thumbnails: {i}/{total}", file=sys.stderr, end="\r")
+    print(file=sys.stderr)
+    return frozenset(done)
+
+
+def run_server(
+    image_dir: Path,
+    labels_path: Path,
+    port: int = DEFAULT_PORT,
+    thumbnails: bool = True,
+) -> None:
     image_dir = image_dir.resolve()
     labels_path = labels_path.resolve()
     image_names = discover_images(image_dir)
@@ -380,8 +502,13 @@ def run_server(image_dir: Path, labels_path: Path, port: int = DEFAULT_PORT) ->
     LabelHandler.image_dir = image_dir
     LabelHandler.labels_path = labels_path
     LabelHandler.image_names = image_names
+    LabelHandler.image_name_set = frozenset(image_names)
+    LabelHandler.labels = load_labels(labels_path)
+    LabelHandler.thumbs_dir = image_dir / THUMB_DIR_NAME
+    if thumbnails:
+        LabelHandler.thumb_names = build_thumbnails(image_dir, image_names, LabelHandler.thumbs_dir)
 
-    server = HTTPServer(("127.0.0.1", port), LabelHandler)
+    server = ThreadingHTTPServer(("127.0.0.1", port), LabelHandler)
     url = f"http://localhost:{port}"
     print(f"Serving {len(image_names)} images from {image_dir}", file=sys.stderr)
     print(f"Labels will be saved to {labels_path}", file=sys.stderr)
@@ -416,6 +543,11 @@ def main() -> None:
         default=DEFAULT_PORT,
         help=f"HTTP port (default: {DEFAULT_PORT})",
     )
+    parser.add_argument(
+        "--no-thumbs",
+        action="store_true",
+        help=f"Serve full-size images to the grid instead of cached {THUMB_SIZE}px thumbnails",
+    )
     args = parser.parse_args()
 
     if not args.directory.is_dir():
@@ -423,7 +555,7 @@ def main() -> None:
         sys.exit(1)
 
     labels_path = args.labels or (args.directory / "labels.json")
-    run_server(args.directory, labels_path, port=args.port)
+    run_server(args.directory, labels_path, port=args.port, thumbnails=not args.no_thumbs)
 
 
 if __name__ == "__main__":
@@ -5,21 +5,27 @@ for download_media.py.
 """
 from __future__ import annotations
 
+import codecs
 import json
 import logging
+import os
 import re
+import sys
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO
+
+import jsonio
 
 logger = logging.getLogger(__name__)
 
 
-# Possible locations and prefixes for likes in the archive
+# Possible locations for likes in the archive
 LIKE_FILE_NAMES = ("like.js", "liked_tweets.js")
-LIKE_JS_PREFIXES = (
-    "window.YTD.like.part0 = ",
-    "window.YTD.liked_tweets.part0 = ",
-)
+# JS assignment in front of the JSON array, e.g. "window.YTD.like.part0 = "
+# or "window.YTD.liked_tweets.part3 = " in split archives
+_JS_PREFIX_RE = re.compile(r"window\.YTD\.\w+\.part\d+\s*=\s*")
 DATA_DIR = "data"
 
 
@@ -42,23 +48,60 @@ def find_like_files(archive_dir: Path) -> list[Path]:
     return sorted(found)
 
 
+def _js_prefix_len(raw: str) -> int:
+    """Length of the window.YTD.* assignment prefix at the start of raw (0 if none)."""
+    m = _JS_PREFIX_RE.match(raw)
+    return m.end() if m else 0
+
+
 def strip_js_prefix(raw: str) -> str:
     """Remove window.YTD.like.part0 = (or similar) to get valid JSON."""
-    for prefix in LIKE_JS_PREFIXES:
-        if raw.startswith(prefix):
-            return raw[len(prefix) :].strip()
-    # Try regex for part0, part1, etc.
-    m = re.match(r"^window\.YTD\.\w+\.part\d+\s*=\s*", raw)
-    if m:
-        return raw[m.end() :].strip()
-    return raw.strip()
+    return raw[_js_prefix_len(raw) :].strip()
+
+
+# Enough bytes to cover any "window.YTD.<name>.partN = " assignment prefix
+_PREFIX_PROBE_BYTES = 256
+
+
+class _ReplaceInvalidUtf8:
+    """Binary reader that swaps invalid UTF-8 in f for U+FFFD, chunk by chunk.
+
+    Archive parts occasionally carry a stray invalid byte inside a tweet's
+    text; this keeps that from failing the whole part.
+
+    >>> import io
+    >>> _ReplaceInvalidUtf8(io.BytesIO(b'["x\\xffy"]')).read()
+    b'["x\\xef\\xbf\\xbdy"]'
+    """
+
+    def __init__(self, f: BinaryIO) -> None:
+        self._f = f
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def read(self, size: int = -1) -> bytes:
+        while True:
+            data = self._f.read(size)
+            # A sequence split across chunks is held back until the next read;
+            # never return b"" before EOF, readers take that as end of input
+            out = self._decoder.decode(data, final=not data or size < 0)
+            if out or not data:
+                return out.encode("utf-8")
 
 
-def parse_like_js(path: Path) -> list[Any]:
-    """Parse a single like.js file and return the JSON array of entries."""
-    text = path.read_text(encoding="utf-8", errors="replace")
-    json_str = strip_js_prefix(text)
-    return json.loads(json_str)
+def parse_like_js(path: Path) -> Iterator[Any]:
+    """Yield the entries of the JSON array in a single like.js file.
+
+    The assignment prefix is skipped by seeking past it and the array is
+    streamed (see jsonio.iter_array), so a large archive part is never held
+    in memory as one string. Invalid UTF-8 is replaced rather than fatal.
+    Raises json.JSONDecodeError on malformed input, possibly after some
+    entries have already been yielded.
+    """
+    with path.open("rb") as f:
+        # latin-1 maps bytes 1:1 to characters, so the match length is a byte offset
+        head = f.read(_PREFIX_PROBE_BYTES).decode("latin-1")
+        f.seek(_js_prefix_len(head))
+        yield from jsonio.iter_array(_ReplaceInvalidUtf8(f))
 
 
 # Fields present in ID-only archive entries (no full tweet data).
@@ -86,38 +129,44 @@ def get_tweet_from_entry(entry: dict[str, Any]) -> dict[str, Any] | None:
     return entry
 
 
+_VIDEO_TYPES = frozenset({"video", "animated_gif"})
+
+
 def get_media_urls(tweet: dict[str, Any], photos_only: bool = True) -> list[str]:
     """
     Extract image media URLs from a tweet. Prefer extended_entities, then entities.
     If photos_only, skip video/gif (type "video" or "animated_gif").
-    Uses extended_entities when available (superset); falls back to entities.
-    Deduplicates by URL.
+    Uses extended_entities when available (superset); falls back to entities
+    only if extended_entities yields nothing (e.g. a video tweet, whose
+    entities still carry the photo thumbnail). Deduplicates by URL.
     """
+    # extended_entities is the superset; only fall back to entities if it's absent/empty
+    urls = _media_urls_from((tweet.get("extended_entities") or {}).get("media"), photos_only)
+    if not urls:
+        urls = _media_urls_from((tweet.get("entities") or {}).get("media"), photos_only)
+    return urls
+
+
+def _media_urls_from(media: Any, photos_only: bool) -> list[str]:
+    """Single pass over one entities.media list; see get_media_urls."""
     urls: list[str] = []
+    if not media:
+        return urls
     seen: set[str] = set()
-    # extended_entities is the superset; only fall back to entities if it's absent/empty
-    for key in ("extended_entities", "entities"):
-        entities = tweet.get(key) or {}
-        media = entities.get("media") or []
-        if not media:
+    for m in media:
+        if not isinstance(m, dict):
+            continue
+        if photos_only and (m.get("type") or "").lower() in _VIDEO_TYPES:
+            continue
+        url = m.get("media_url_https") or m.get("media_url")
+        if not url:
             continue
-        for m in media:
-            if not isinstance(m, dict):
-                continue
-            kind = (m.get("type") or "").lower()
-            if photos_only and kind in ("video", "animated_gif"):
-                continue
-            url = m.get("media_url_https") or m.get("media_url")
-            if url:
-                # Prefer large size for images
-                if "?" not in url and ("pbs.twimg.com" in url or "twimg.com" in url):
-                    url = url + "?format=jpg&name=large"
-                if url not in seen:
-                    seen.add(url)
-                    urls.append(url)
-        # If we got results from extended_entities, skip entities (avoid dupes)
-        if urls:
-            break
+        # Prefer large size for images
+        if "?" not in url and "twimg.com" in url:
+            url = url + "?format=jpg&name=large"
+        if url not in seen:
+            seen.add(url)
+            urls.append(url)
     return urls
 
 
@@ -127,21 +176,27 @@ def get_username(tweet: dict[str, Any]) -> str:
     return user.get("username") or user.get("screen_name") or "unknown"
 
 
+_MONTH_MAP = {
+    "Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04", "May": "05", "Jun": "06",
+    "Jul": "07", "Aug": "08", "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12",
+}
+
+
 def get_created_at(tweet: dict[str, Any]) -> str:
     """Get tweet date as YYYY-MM-DD."""
     created = tweet.get("created_at") or tweet.get("date") or ""
     # "Wed Oct 10 20:19:24 +0000 2018" or ISO
     if not created:
         return ""
+    # Fixed-width archive format "Wed Oct 10 20:19:24 +0000 2018": slice directly
+    if len(created) == 30 and created[19:21] == " +" and created[8:10].isdigit():
+        month = created[4:7]
+        return f"{created[26:]}-{_MONTH_MAP.get(month, month)}-{created[8:10]}"
     if " " in created and "+" in created:
         parts = created.split()
         if len(parts) >= 6:
-            # e.g. "Wed Oct 10 20:19:24 +0000 2018"
             month, day, year = parts[1], parts[2], parts[5]
-            month_map = {"Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04", "May": "05",
-                         "Jun": "06", "Jul": "07", "Aug": "08", "Sep": "09", "Oct": "10",
-                         "Nov": "11", "Dec": "12"}
-            return f"{year}-{month_map.get(month[:3], month)}-{day.zfill(2)}"
+            return f"{year}-{_MONTH_MAP.get(month[:3], month)}-{day.zfill(2)}"
     if created.startswith("20") and "-" in created:
         return created[:10]
     return created
@@ -169,55 +224,110 @@ def extract_tweets_with_media(
     If include_id_only=True, also emits likes that only have tweetId/fullText (media_urls=[])
     so they can be resolved via gallery-dl or the API.
     """
-    like_files = find_like_files(archive_dir)
-    if not like_files:
-        return []
+    return extract_tweets_from_archives([(archive_dir, like_source_label)], include_id_only)[0]
 
-    records: list[dict[str, Any]] = []
-    seen_tweet_ids: set[str] = set()
 
-    for path in like_files:
-        try:
-            entries = parse_like_js(path)
-        except (json.JSONDecodeError, OSError) as exc:
-            logger.warning("Failed to parse %s: %s", path, exc)
+def extract_tweets_from_archives(
+    archives: Sequence[tuple[Path, str]],
+    include_id_only: bool = False,
+) -> list[list[dict[str, Any]]]:
+    """
+    extract_tweets_with_media for several (archive_dir, like_source_label) pairs
+    at once. The like.js parts of all archives share one process pool. Returns
+    one record list per archive, in input order, each deduped on its own.
+    """
+    # (archive index, like file, like_source) for every part of every archive
+    jobs: list[tuple[int, Path, str]] = []
+    for i, (archive_dir, like_source_label) in enumerate(archives):
+        like_source = like_source_label or str(archive_dir)
+        jobs.extend((i, path, like_source) for path in find_like_files(archive_dir))
+
+    # Archives and split archives' parts are independent; parse them in
+    # separate processes (JSON parsing is CPU-bound) and dedup centrally.
+    paths = [path for _, path, _ in jobs]
+    sources = [like_source for _, _, like_source in jobs]
+    workers = min(len(jobs), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(
+                _parse_like_file, paths, sources, [include_id_only] * len(jobs),
+            ))
+    else:
+        parts = [_parse_like_file(p, src, include_id_only) for p, src in zip(paths, sources)]
+
+    results: list[list[dict[str, Any]]] = [[] for _ in archives]
+    seen: list[set[str]] = [set() for _ in archives]
+    for (i, path, _), (part_records, error) in zip(jobs, parts):
+        if error:
+            # Entries parsed before the error are kept
+            logger.warning("Failed to parse %s: %s", path, error)
+        records, seen_tweet_ids = results[i], seen[i]
+        for rec in part_records:
+            if rec["tweet_id"] not in seen_tweet_ids:
+                seen_tweet_ids.add(rec["tweet_id"])
+                records.append(rec)
+    return results
+
+
+def _parse_like_file(
+    path: Path,
+    like_source: str,
+    include_id_only: bool,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """Records from one like.js part (deduped within the part) and any parse error.
+
+    Runs in a worker process, so errors are returned rather than logged.
+    """
+    records: list[dict[str, Any]] = []
+    try:
+        _collect_entries(parse_like_js(path), records, set(), like_source, include_id_only)
+    except (json.JSONDecodeError, OSError) as exc:
+        return records, str(exc)
+    return records, None
+
+
+def _collect_entries(
+    entries: Iterable[Any],
+    records: list[dict[str, Any]],
+    seen_tweet_ids: set[str],
+    like_source: str,
+    include_id_only: bool,
+) -> None:
+    """Append a record for each new media (or ID-only) like in entries."""
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        tweet = get_tweet_from_entry(entry)
+        if tweet is None:
+            inner = entry.get("like") or {}
+            tid = str(inner.get("tweetId") or "")
+            if tid and tid not in seen_tweet_ids and include_id_only:
+                seen_tweet_ids.add(tid)
+                records.append({
+                    "tweet_id": tid,
+                    "username": "unknown",
+                    "date": "",
+                    "media_urls": [],
+                    "text": inner.get("fullText") or "",
+                    "like_source": like_source,
+                })
             continue
 
-        for entry in entries:
-            if not isinstance(entry, dict):
-                continue
-            tweet = get_tweet_from_entry(entry)
-            if tweet is None:
-                inner = entry.get("like") or {}
-                tid = str(inner.get("tweetId") or "")
-                if tid and tid not in seen_tweet_ids and include_id_only:
-                    seen_tweet_ids.add(tid)
-                    records.append({
-                        "tweet_id": tid,
-                        "username": "unknown",
-                        "date": "",
-                        "media_urls": [],
-                        "text": inner.get("fullText") or "",
-                        "like_source": like_source_label or str(archive_dir),
-                    })
-                continue
-
-            tweet_id = get_tweet_id(tweet)
-            if not tweet_id or tweet_id in seen_tweet_ids:
-                continue
-            media_urls = get_media_urls(tweet, photos_only=True)
-            if not media_urls and not include_id_only:
-                continue
-            seen_tweet_ids.add(tweet_id)
-            records.append({
-                "tweet_id": tweet_id,
-                "username": get_username(tweet),
-                "date": get_created_at(tweet),
-                "media_urls": media_urls or [],
-                "text": get_full_text(tweet),
-                "like_source": like_source_label or str(archive_dir),
-            })
-    return records
+        tweet_id = get_tweet_id(tweet)
+        if not tweet_id or tweet_id in seen_tweet_ids:
+            continue
+        media_urls = get_media_urls(tweet, photos_only=True)
+        if not media_urls and not include_id_only:
+            continue
+        seen_tweet_ids.add(tweet_id)
+        records.append({
+            "tweet_id": tweet_id,
+            "username": get_username(tweet),
+            "date": get_created_at(tweet),
+            "media_urls": media_urls or [],
+            "text": get_full_text(tweet),
+            "like_source": like_source,
+        })
 
 
 def main() -> None:
@@ -242,14 +352,14 @@ def main() -> None:
 
     if args.sample:
         for i, r in enumerate(all_records[: args.sample]):
-            print(json.dumps(r, indent=2, ensure_ascii=False))
+            print(jsonio.dumps(r).decode("utf-8"))
         return
 
     out = args.output
     if out:
-        out.write_text(json.dumps(all_records, indent=2, ensure_ascii=False), encoding="utf-8")
+        jsonio.write_json(out, all_records)
     else:
-        print(json.dumps(all_records, indent=2, ensure_ascii=False))
+        sys.stdout.buffer.write(jsonio.dumps(all_records) + b"\n")
 
 
 if __name__ == "__main__":
@@ -4,30 +4,47 @@ Optional: embed sanitized title in filename or write sidecar JSON.
 """
 from __future__ import annotations
 
-import json
+import contextlib
+import functools
 import logging
+import os
 import re
 import shutil
+import stat
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
+import jsonio
+
 logger = logging.getLogger(__name__)
 
+_USERNAME_WS_RE = re.compile(r"[\s/\\]+")
+_USERNAME_INVALID_RE = re.compile(r"[^\w\-.]")
+_TITLE_URL_RE = re.compile(r"https?://\S+")
+_TITLE_WS_RE = re.compile(r"\s+")
+_TITLE_INVALID_RE = re.compile(r"[^\w\s\-.,'!?]")
+
+RENAME_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
+
+# Archives are dominated by a few thousand authors at most
+@functools.lru_cache(maxsize=4096)
 def sanitize_username(s: str, max_len: int = 40) -> str:
     """Replace spaces/slashes with underscore, remove invalid chars, truncate."""
-    s = re.sub(r"[\s/\\]+", "_", s)
-    s = re.sub(r"[^\w\-.]", "", s)
+    s = _USERNAME_WS_RE.sub("_", s)
+    s = _USERNAME_INVALID_RE.sub("", s)
     return s[:max_len] if len(s) > max_len else s or "unknown"
 
 
 def sanitize_title(text: str, max_len: int = 40) -> str:
     """Remove URLs, collapse whitespace, truncate, safe for filename."""
-    # Remove URLs
-    text = re.sub(r"https?://\S+", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    text = re.sub(r"[^\w\s\-.,'!?]", "", text)
+    # Remove URLs (substring check first: most tweet texts have none)
+    if "://" in text:
+        text = _TITLE_URL_RE.sub("", text)
+    text = _TITLE_WS_RE.sub(" ", text).strip()
+    text = _TITLE_INVALID_RE.sub("", text)
     text = text.replace(" ", "_")[:max_len].strip("_")
     return text or ""
 
@@ -50,68 +67,120 @@ def build_filename(
     return f"{user}_{safe_date}_{tweet_id}_{index}.{ext}"
 
 
+def _move(move: tuple[Path, Path, bool, Any]) -> None:
+    src, dest, same_dev, _meta = move
+    if same_dev:
+        os.replace(src, dest)
+    else:
+        shutil.move(str(src), str(dest))
+
+
 def rename_from_manifest(
     manifest_path: Path,
     output_dir: Path,
     include_title: bool = False,
     sidecar_path: Path | None = None,
+    return_sidecar: bool = True,
 ) -> list[dict[str, Any]]:
     """
     Read manifest (list of { path, tweet_id, index, username, date, text, like_source }),
     rename each file to username_date_tweetid_index.ext in output_dir, and optionally
     write a sidecar JSON mapping filename -> metadata.
+    Returns the sidecar metadata written; pass return_sidecar=False to skip
+    collecting it (it is already on disk).
     """
     manifest_path = Path(manifest_path)
     output_dir = Path(output_dir)
-    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest = jsonio.read_json(manifest_path)
     output_dir.mkdir(parents=True, exist_ok=True)
-    sidecar: dict[str, dict[str, Any]] = {}
-
+    # Resolved once; dest paths are built under out_root so they need no resolve
+    out_root = output_dir.resolve()
+    allowed_roots = (out_root, Path.cwd().resolve())
+    out_dev = out_root.stat().st_dev
+    out_str = str(out_root)
+
+    # Plan every move first (all path computation and existence checks),
+    # then run the renames concurrently. Names claimed earlier in this run
+    # count as taken, exactly as if those files had already been moved.
+    moves: list[tuple[Path, Path, bool, dict[str, Any] | None]] = []
+    claimed: set[Path] = set()
+    # Local aliases for the per-entry calls; this loop runs once per image
+    abspath = os.path.abspath
+    join = os.path.join
+    splitext = os.path.splitext
+    build = build_filename
     for entry in manifest:
-        src = Path(entry.get("path") or "").resolve()
-        if not src.is_file():
+        get = entry.get
+        raw_path = get("path") or ""
+        username = get("username") or "unknown"
+        date = get("date") or ""
+        tweet_id = get("tweet_id") or ""
+        index = get("index", 0)
+        text = get("text") or ""
+        ext = splitext(raw_path)[1][1:].lower() or "jpg"
+        title = (text if include_title else None)
+        name = build(username, date, tweet_id, index, ext, title=title)
+        # Plain strings until here: already-renamed entries (the usual re-run
+        # case) are skipped without building any Path or touching the filesystem
+        dest_str = join(out_str, name)
+        if abspath(raw_path) == dest_str:
+            continue
+
+        dest = Path(dest_str)
+        src = Path(raw_path).resolve()
+        if src in claimed:
+            # Same file listed twice; it is already being moved
+            continue
+        try:
+            src_stat = src.stat()
+        except OSError:
+            continue
+        if not stat.S_ISREG(src_stat.st_mode):
             continue
         # Path containment: reject paths that escape expected directories
-        if not any(
-            src.is_relative_to(allowed)
-            for allowed in (output_dir.resolve(), Path.cwd().resolve())
-        ):
+        if not any(src.is_relative_to(allowed) for allowed in allowed_roots):
             logger.warning("Skipping file outside allowed directories: %s", src)
             continue
-        username = entry.get("username") or "unknown"
-        date = entry.get("date") or ""
-        tweet_id = entry.get("tweet_id") or ""
-        index = entry.get("index", 0)
-        text = entry.get("text") or ""
-        ext = src.suffix.lstrip(".").lower() or "jpg"
-        title = (text if include_title else None)
-        name = build_filename(username, date, tweet_id, index, ext, title=title)
-        dest = output_dir / name
-        if dest.resolve() == src:
-            continue
-        if dest.exists() and dest.resolve() != src:
+        if dest in claimed or dest.exists():
+            if dest not in claimed and dest.resolve() == src:
+                continue
             # Avoid overwrite: append a suffix until unique
             base = dest.stem
-            dest = output_dir / f"{base}_{tweet_id}.{ext}"
+            dest = out_root / f"{base}_{tweet_id}.{ext}"
             counter = 2
-            while dest.exists() and dest.resolve() != src:
-                dest = output_dir / f"{base}_{tweet_id}_{counter}.{ext}"
+            while dest in claimed or (dest.exists() and dest.resolve() != src):
+                dest = out_root / f"{base}_{tweet_id}_{counter}.{ext}"
                 counter += 1
-        shutil.move(str(src), str(dest))
+        claimed.add(src)
+        claimed.add(dest)
+        meta = None
         if sidecar_path is not None:
-            sidecar[dest.name] = {
+            meta = {
                 "username": username,
                 "date": date,
                 "tweet_id": tweet_id,
                 "title": text[:200],
-                "like_source": entry.get("like_source", ""),
+                "like_source": get("like_source", ""),
             }
+        moves.append((src, dest, src_stat.st_dev == out_dev, meta))
 
-    if sidecar_path is not None and sidecar:
-        sidecar_path.parent.mkdir(parents=True, exist_ok=True)
-        sidecar_path.write_text(json.dumps(sidecar, indent=2, ensure_ascii=False), encoding="utf-8")
+    # Streamed member by member rather than built as one dict. ObjectWriter
+    # only replaces sidecar_path if at least one file was renamed.
+    sidecar: jsonio.ObjectWriter | None = None
+    written: list[dict[str, Any]] = []
+    with contextlib.ExitStack() as stack:
+        if sidecar_path is not None:
+            sidecar_path.parent.mkdir(parents=True, exist_ok=True)
+            sidecar = stack.enter_context(jsonio.ObjectWriter(sidecar_path))
+        # Renames are syscall-latency bound, so threads overlap them well
+        with ThreadPoolExecutor(max_workers=RENAME_WORKERS) as pool:
+            for (_src, dest, _same_dev, meta), _ in zip(moves, pool.map(_move, moves)):
+                if sidecar is not None and meta is not None:
+                    sidecar.write(dest.name, meta)
+                    if return_sidecar:
+                        written.append(meta)
 
-    return list(sidecar.values()) if sidecar else []
+    return written
 
 
 def main() -> None:
@@ -128,6 +197,7 @@ def main() -> None:
         args.output_dir,
         include_title=args.include_title,
         sidecar_path=args.sidecar,
+        return_sidecar=False,
     )
     print(f"Renamed files into {args.output_dir}", file=sys.stderr)
 
@@ -8,19 +8,27 @@ from __future__ import annotations
 
 import json
 import logging
+import os
+import re
 import subprocess
 import sys
 from pathlib import Path
 from typing import Any
 
+import jsonio
+
 logger = logging.getLogger(__name__)
 
 _IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".webp"})
+_IMAGE_EXT_TUPLE = tuple(_IMAGE_EXTENSIONS)  # for str.endswith
+# Filename pattern from _write_gdl_config: {tweet_id}_{num}.{ext}
+_STEM_RE = re.compile(r"(\d+)_(\d+)")
+_TWEET_URL_PREFIX = "https://x.com/i/web/status/"
 
 
 def build_tweet_url(tweet_id: str) -> str:
     """Construct a tweet URL suitable for gallery-dl."""
-    return f"https://x.com/i/web/status/{tweet_id}"
+    return f"{_TWEET_URL_PREFIX}{tweet_id}"
 
 
 def _write_gdl_config(config_path: Path) -> None:
@@ -58,29 +66,38 @@ def _collect_manifest_entries(
     """
     manifest: list[dict[str, Any]] = []
 
-    for img_path in sorted(output_dir.iterdir()):
-        if img_path.suffix.lower() not in _IMAGE_EXTENSIONS:
-            continue
-
-        # Filename pattern from config: {tweet_id}_{num}.{ext}
-        parts = img_path.stem.rsplit("_", 1)
-        if len(parts) != 2:
-            continue
-        tweet_id, num_str = parts
-        try:
-            num = int(num_str)
-        except ValueError:
+    # One directory pass: image files plus the names of metadata JSONs, so
+    # checking for a sidecar is a set lookup rather than a stat per image
+    images: list[os.DirEntry[str]] = []
+    meta_names: set[str] = set()
+    with os.scandir(output_dir) as it:
+        for e in it:
+            name_lower = e.name.lower()
+            if name_lower.endswith(".json"):
+                meta_names.add(e.name)
+            elif name_lower.endswith(_IMAGE_EXT_TUPLE) and e.is_file():
+                images.append(e)
+    images.sort(key=lambda e: e.name)
+    resolved_dir = output_dir.resolve()
+
+    for e in images:
+        img_path = Path(e.path)
+
+        m = _STEM_RE.fullmatch(img_path.stem)
+        if not m:
             continue
+        tweet_id, num = m.group(1), int(m.group(2))
 
         username = "unknown"
         date_str = ""
         content = ""
 
         # gallery-dl metadata postprocessor writes {filename}.json next to the image
-        meta_path = img_path.with_name(img_path.name + ".json")
-        if meta_path.is_file():
+        meta_name = e.name + ".json"
+        if meta_name in meta_names:
+            meta_path = output_dir / meta_name
             try:
-                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                meta = jsonio.read_json(meta_path)
                 author = meta.get("author") or meta.get("user") or {}
                 username = author.get("name") or author.get("screen_name") or "unknown"
                 raw_date = str(meta.get("date") or "")
@@ -101,7 +118,7 @@ def _collect_manifest_entries(
         manifest.append({
             "tweet_id": tweet_id,
             "index": num - 1,  # gallery-dl num is 1-based; manifest uses 0-based
-            "path": str(img_path.resolve()),
+            "path": str(img_path.resolve() if e.is_symlink() else resolved_dir / e.name),
             "username": username,
             "date": date_str,
             "text": content,
@@ -159,10 +176,9 @@ def resolve_and_download(
 
     record_by_id = {r["tweet_id"]: r for r in to_scrape}
 
-    # Write URL list for gallery-dl --input-file
-    url_file = output_dir / "_gdl_urls.txt"
-    urls = [build_tweet_url(r["tweet_id"]) for r in to_scrape]
-    url_file.write_text("\n".join(urls) + "\n", encoding="utf-8")
+    # URL list is piped to gallery-dl's stdin (--input-file -), one process for all tweets
+    # (build_tweet_url inlined: this runs once per tweet)
+    urls = [_TWEET_URL_PREFIX + r["tweet_id"] for r in to_scrape]
 
     # Write gallery-dl config
     config_path = output_dir / "_gdl_config.json"
@@ -173,7 +189,7 @@ def resolve_and_download(
         "--cookies-from-browser", browser,
         "--dest", str(output_dir),
         "--config", str(config_path),
-        "--input-file", str(url_file),
+        "--input-file", "-",
     ]
 
     logger.info("Running: %s", " ".join(cmd))
@@ -181,6 +197,7 @@ def resolve_and_download(
     try:
         result = subprocess.run(
             cmd,
+            input="\n".join(urls) + "\n",
             capture_output=True,
             text=True,
             timeout=300 + len(to_scrape) * 15,
@@ -211,10 +228,7 @@ def resolve_and_download(
 
     # Write manifest
     manifest_path.parent.mkdir(parents=True, exist_ok=True)
-    manifest_path.write_text(
-        json.dumps(manifest_entries, indent=2, ensure_ascii=False),
-        encoding="utf-8",
-    )
+    jsonio.write_json(manifest_path, manifest_entries)
 
     unique_tweets = len({e["tweet_id"] for e in manifest_entries})
     print(
@@ -224,7 +238,6 @@ def resolve_and_download(
     )
 
     # Cleanup temp files
-    url_file.unlink(missing_ok=True)
     config_path.unlink(missing_ok=True)
 
     return manifest_entries
@@ -276,7 +289,7 @@ def main() -> None:
     )
     args = parser.parse_args()
 
-    records = json.loads(args.input.read_text(encoding="utf-8"))
+    records = jsonio.read_json(args.input)
 
     entries = resolve_and_download(
         records,
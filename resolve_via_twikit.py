@@ -6,13 +6,20 @@ Requires X account credentials (username + password) or saved cookies.
 from __future__ import annotations
 
 import asyncio
-import json
 import os
+import re
 import sys
 import time
 from pathlib import Path
 from typing import Any
 
+import jsonio
+
+
+# KEY=value lines; comment lines (leading #) and lines without a key never match.
+# Whitespace around key and value is dropped; quotes are stripped afterwards.
+_ENV_LINE_RE = re.compile(r"^[ \t]*([^#\s=][^=\n]*?)[ \t]*=[ \t]*(.*?)[ \t\r]*$", re.M)
+
 
 def _load_dotenv() -> None:
     """Load .env vars into os.environ (same logic as fetch_likes_api)."""
@@ -21,13 +28,10 @@ def _load_dotenv() -> None:
     for d in (Path.cwd(), Path(__file__).resolve().parent):
         env_file = d / base
         if env_file.is_file():
-            for line in env_file.read_text().splitlines():
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    k, _, v = line.partition("=")
-                    k, v = k.strip(), v.strip().strip("'\"")
-                    if k and v:
-                        os.environ.setdefault(k, v)
+            for m in _ENV_LINE_RE.finditer(env_file.read_text()):
+                v = m.group(2).strip("'\"")
+                if v:
+                    os.environ.setdefault(m.group(1), v)
             break
 
 
@@ -163,6 +167,8 @@ def resolve_tweets(
     delay: float = 1.0,
 ) -> tuple[list[dict[str, Any]], set[str]]:
     """Synchronous entry point. Returns (records_with_media, resolved_ids)."""
+    # Duplicate IDs would each cost a lookup slot
+    tweet_ids = list(dict.fromkeys(i for i in tweet_ids if i))
 
     async def _run():
         client = await _get_client()
@@ -196,7 +202,7 @@ def main() -> None:
     print(f"Resolving {len(ids)} tweet IDs via twikit...", file=sys.stderr, flush=True)
     records, resolved = resolve_tweets(ids, batch_size=args.batch_size, delay=args.delay)
     print(f"Done: {len(records)} tweets with media, {len(resolved)} total resolved.", file=sys.stderr, flush=True)
-    print(json.dumps(records, indent=2, ensure_ascii=False))
+    sys.stdout.buffer.write(jsonio.dumps(records) + b"\n")
 
 
 if __name__ == "__main__":
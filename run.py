@@ -9,24 +9,22 @@ via gallery-dl using browser cookies.
 """
 from __future__ import annotations
 
-import json
+import argparse
+import functools
 import logging
 import sys
 from pathlib import Path
 from typing import Any
 
-from parse_archive import extract_tweets_with_media
+import jsonio
+from parse_archive import extract_tweets_from_archives
 from download_media import download_all
 from rename_and_organize import rename_from_manifest
 
 
-def main() -> None:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(levelname)s: %(message)s",
-        stream=sys.stderr,
-    )
-    import argparse
+@functools.cache
+def _build_parser() -> argparse.ArgumentParser:
+    """CLI parser, built once per process (main() may be called repeatedly in-process)."""
     parser = argparse.ArgumentParser(
         description="Twitter likes → art backgrounds: download, rename, and optionally filter.",
     )
@@ -85,6 +83,12 @@ def main() -> None:
         default=30,
         help="Download timeout per image in seconds (default: 30)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="Concurrent CDN downloads (default: 16)",
+    )
     parser.add_argument(
         "--browser",
         default="brave",
@@ -97,7 +101,17 @@ def main() -> None:
         default=None,
         help="Limit number of tweets to resolve via gallery-dl.",
     )
-    args = parser.parse_args()
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(levelname)s: %(message)s",
+        stream=sys.stderr,
+    )
+    parser = _build_parser()
+    args = parser.parse_args(argv)
 
     if not args.archives and not args.api:
         parser.error("Provide archive directories or use --api")
@@ -117,38 +131,46 @@ def main() -> None:
         log(f"[1/5] Fetched {len(all_records)} tweets with media from API.")
     else:
         log(f"[1/5] Parsing {len(args.archives)} archive(s)...")
+        archives: list[Path] = []
         for arch in args.archives:
             arch = Path(arch)
             if not arch.is_dir():
                 log(f"  Warning: not a directory: {arch}")
                 continue
-            recs = extract_tweets_with_media(
-                arch, like_source_label=arch.name, include_id_only=True,
-            )
+            archives.append(arch)
+        # All archives' like.js parts are parsed in one process pool
+        per_archive = extract_tweets_from_archives(
+            [(arch, arch.name) for arch in archives], include_id_only=True,
+        )
+        for arch, recs in zip(archives, per_archive):
             log(f"  {arch.name}: {len(recs)} likes")
             all_records.extend(recs)
         log(f"[1/5] Parsed {len(all_records)} likes total.")
 
-    # Dedupe by tweet_id across archives / API calls
+    # Dedupe by tweet_id across archives / API calls, keeping the first record
     seen_ids: set[str] = set()
     unique: list[dict[str, Any]] = []
+    seen_add = seen_ids.add
+    unique_append = unique.append
     for r in all_records:
-        tid = r.get("tweet_id") or ""
+        tid = r.get("tweet_id")
         if tid and tid not in seen_ids:
-            seen_ids.add(tid)
-            unique.append(r)
+            seen_add(tid)
+            unique_append(r)
 
     log(f"[1/5] {len(unique)} unique tweets after dedup.")
 
     if args.no_download:
         if unique:
-            print(json.dumps(unique[:3], indent=2, ensure_ascii=False))
+            print(jsonio.dumps(unique[:3]).decode("utf-8"))
         return
 
     # --- Step 2: Resolve ID-only records ---
     manifest_path = args.download_dir / "manifest.json"
-    id_only = [r for r in unique if not r.get("media_urls")]
-    has_media = [r for r in unique if r.get("media_urls")]
+    id_only: list[dict[str, Any]] = []
+    has_media: list[dict[str, Any]] = []
+    for r in unique:
+        (has_media if r.get("media_urls") else id_only).append(r)
 
     all_entries: list[dict[str, Any]] = []
 
@@ -157,21 +179,21 @@ def main() -> None:
             id_only = id_only[:args.limit]
             log(f"[2/5] Limited to {len(id_only)} tweets (--limit {args.limit}).")
 
-        unresolved = id_only  # tracks what still needs fallback
+        # tweet_id -> record still needing a fallback, in id_only order
+        pending = {r["tweet_id"]: r for r in id_only}
 
         # Strategy: twikit (free, internal API) → paid X API → gallery-dl
         try:
             from resolve_via_twikit import resolve_tweets
             log(f"[2/5] Resolving {len(id_only)} tweets via twikit (internal API)...")
-            resolved_records, resolved_ids = resolve_tweets(
-                [r["tweet_id"] for r in id_only],
-            )
+            resolved_records, resolved_ids = resolve_tweets(list(pending))
             if resolved_records:
                 has_media.extend(resolved_records)
                 log(f"[2/5] twikit resolved {len(resolved_records)} tweets with media.")
-            unresolved = [r for r in id_only if r["tweet_id"] not in resolved_ids]
-            if unresolved:
-                log(f"[2/5] {len(unresolved)} tweets unresolved by twikit.")
+            for rid in resolved_ids:
+                pending.pop(rid, None)
+            if pending:
+                log(f"[2/5] {len(pending)} tweets unresolved by twikit.")
             else:
                 log("[2/5] All tweets resolved via twikit.")
         except Exception as exc:
@@ -187,20 +209,21 @@ def main() -> None:
                     log("[2/5] Using OAuth 1.0a auth...")
                 resolved_records, resolved_ids = fetch_tweets_by_ids(
                     session,
-                    [r["tweet_id"] for r in unresolved],
+                    list(pending),
                 )
                 if resolved_records:
                     has_media.extend(resolved_records)
                     log(f"[2/5] API resolved {len(resolved_records)} tweets with media.")
-                unresolved = [r for r in unresolved if r["tweet_id"] not in resolved_ids]
+                for rid in resolved_ids:
+                    pending.pop(rid, None)
             except Exception as exc2:
                 log(f"[2/5] Paid API also unavailable: {exc2}")
 
-        if unresolved:
+        if pending:
             from resolve_via_scrape import resolve_and_download
-            log(f"[2/5] Resolving {len(unresolved)} remaining tweets via gallery-dl (browser: {args.browser})...")
+            log(f"[2/5] Resolving {len(pending)} remaining tweets via gallery-dl (browser: {args.browser})...")
             scrape_entries = resolve_and_download(
-                unresolved,
+                list(pending.values()),
                 output_dir=args.download_dir,
                 manifest_path=manifest_path,
                 browser=args.browser,
@@ -220,6 +243,7 @@ def main() -> None:
             manifest_path=cdn_manifest,
             skip_existing=True,
             timeout=args.timeout,
+            workers=args.workers,
         )
         all_entries.extend(cdn_entries)
         cdn_manifest.unlink(missing_ok=True)
@@ -227,10 +251,7 @@ def main() -> None:
     else:
         log("[3/5] No CDN downloads needed.")
 
-    manifest_path.write_text(
-        json.dumps(all_entries, indent=2, ensure_ascii=False),
-        encoding="utf-8",
-    )
+    jsonio.write_json(manifest_path, all_entries)
     log(f"[3/5] Manifest: {len(all_entries)} images total.")
 
     if args.no_rename:
@@ -246,7 +267,9 @@ def main() -> None:
             art_manifest = filter_art_from_manifest(manifest_path, args.download_dir)
             if art_manifest and art_manifest.is_file():
                 manifest_to_rename = art_manifest
-                kept = len(json.loads(art_manifest.read_text(encoding="utf-8")))
+                # Count without materializing the filtered manifest
+                with open(art_manifest, "rb") as f:
+                    kept = sum(1 for _ in jsonio.iter_array(f))
                 log(f"[4/5] Art filter kept {kept}/{len(all_entries)} images.")
         except ImportError as e:
             log(f"[4/5] Warning: --filter-art failed: {e}")
@@ -260,6 +283,7 @@ def main() -> None:
         args.output,
         include_title=args.include_title,
         sidecar_path=args.output / "metadata.json",
+        return_sidecar=False,
     )
 
     log(f"[5/5] Done. Output in {args.output}")
@@ -5,20 +5,32 @@ Run:
     python -m webapp.app
 """
 
+import asyncio
 import json
-import random
+import logging
+import os
+import queue
+import sqlite3
+import threading
 import time
 import uuid
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
 from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, Cookie, Request, Response, Query
+from fastapi import FastAPI, Cookie, Depends, Request, Response, Query
 from fastapi.responses import FileResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from .db import get_db, init_db, load_metadata_into_db
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .db import close_pool, get_db, get_db_dep, get_meta, init_db, load_metadata_into_db, release_db, set_meta
+
+logger = logging.getLogger(__name__)
 
 
 # ---------------------------------------------------------------------------
@@ -29,17 +41,29 @@ class RateLimiter:
     def __init__(self, max_requests: int = 120, window_seconds: int = 60):
         self.max_requests = max_requests
         self.window = window_seconds
-        self._hits: dict[str, list[float]] = defaultdict(list)
+        # Last max_requests allowed hits per key, oldest first
+        self._hits: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=self.max_requests))
+        # is_allowed runs on threadpool threads, prune on the event loop
+        self._lock = threading.Lock()
 
     def is_allowed(self, key: str) -> bool:
         now = time.monotonic()
-        hits = self._hits[key]
-        # Prune old entries
-        self._hits[key] = hits = [t for t in hits if now - t < self.window]
-        if len(hits) >= self.max_requests:
-            return False
-        hits.append(now)
-        return True
+        with self._lock:
+            hits = self._hits[key]
+            # Full and the oldest kept hit is still inside the window: that's
+            # max_requests hits in the window already
+            if len(hits) == self.max_requests and now - hits[0] < self.window:
+                return False
+            hits.append(now)
+            return True
+
+    def prune(self) -> None:
+        """Forget keys with no hits inside the window."""
+        now = time.monotonic()
+        with self._lock:
+            for key, hits in list(self._hits.items()):
+                if not hits or now - hits[-1] >= self.window:
+                    del self._hits[key]
 
 
 # 120 votes/min per IP — generous for normal use, blocks spam
@@ -50,15 +74,33 @@ METADATA_PATH = ART_DIR / "metadata.json"
 STATIC_DIR = Path(__file__).resolve().parent / "static"
 
 
+async def _prune_rate_limits():
+    while True:
+        await asyncio.sleep(vote_limiter.window)
+        vote_limiter.prune()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
-    with open(METADATA_PATH) as f:
-        metadata = json.load(f)
-    inserted = load_metadata_into_db(metadata)
-    if inserted:
-        print(f"Loaded {inserted} new images into DB")
+    # Skip parsing metadata.json entirely if it hasn't changed since the last load
+    st = METADATA_PATH.stat()
+    stamp = f"{st.st_mtime_ns}:{st.st_size}"
+    if get_meta("metadata_stamp") != stamp:
+        raw = METADATA_PATH.read_bytes()
+        metadata = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        inserted = load_metadata_into_db(metadata)
+        if inserted:
+            print(f"Loaded {inserted} new images into DB")
+        set_meta("metadata_stamp", stamp)
+    image_table.clear()
+    image_table.update(_scan_images())
+    vote_writer.start()
+    janitor = asyncio.create_task(_prune_rate_limits())
     yield
+    janitor.cancel()
+    vote_writer.stop()
+    close_pool()
 
 
 app = FastAPI(title="Wall Peepo", lifespan=lifespan)
@@ -85,13 +127,49 @@ def dashboard_page():
 # Image serving
 # ---------------------------------------------------------------------------
 
+IMAGE_MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+# Filenames embed tweet id and image index, so a name's content never changes
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# filename -> (path, media type); filled from ART_DIR at startup. Only these
+# names are served, so no request path is ever joined onto ART_DIR.
+image_table: dict[str, tuple[Path, str]] = {}
+
+
+def _scan_images() -> dict[str, tuple[Path, str]]:
+    table = {}
+    with os.scandir(ART_DIR) as it:
+        for e in it:
+            media = IMAGE_MEDIA_TYPES.get(os.path.splitext(e.name)[1].lower())
+            if media and e.is_file():
+                table[e.name] = (Path(e.path), media)
+    return table
+
+
 @app.get("/img/{filename}")
-def serve_image(filename: str):
-    path = ART_DIR / filename
-    if not path.exists():
+def serve_image(filename: str, request: Request):
+    entry = image_table.get(filename)
+    if entry is None:
         return Response(status_code=404)
-    media = "image/jpeg" if filename.endswith(".jpg") else "image/png"
-    return FileResponse(path, media_type=media)
+    path, media = entry
+    try:
+        st = os.stat(path)
+    except OSError:
+        # Deleted since startup
+        return Response(status_code=404)
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    # stat_result saves FileResponse its own stat call
+    return FileResponse(path, media_type=media, headers=headers, stat_result=st)
 
 
 # ---------------------------------------------------------------------------
@@ -100,6 +178,71 @@ def serve_image(filename: str):
 
 ELO_K = 32  # Elo K-factor
 
+# Weighted sampling in one pass (Efraimidis–Spirakis): each candidate gets
+# key Exp(1) / weight and the smallest key wins, which picks a row with
+# probability proportional to its weight. Weights are score - min + 100 over
+# the candidates, as before. sample_key() is registered in db._connect().
+_NEXT_SQL = """
+    WITH cand AS (
+        SELECT id, filename, username, tweet_id, title, score, votes_up, votes_down
+        FROM images
+        {where}
+    )
+    SELECT cand.*, agg.n AS remaining
+    FROM cand, (SELECT COUNT(*) AS n, MIN(score) AS lo FROM cand) AS agg
+    ORDER BY sample_key(cand.score - agg.lo + 100)
+    LIMIT 1
+"""
+# The excluded ids are passed as one JSON array so the SQL text never changes
+_NEXT_UNSEEN_SQL = _NEXT_SQL.format(where="WHERE id NOT IN (SELECT value FROM json_each(?))")
+_NEXT_ANY_SQL = _NEXT_SQL.format(where="")
+
+
+class SeenImages:
+    """The last `per_session` images each session voted on, kept in memory.
+
+    Sessions are loaded from the votes table on first touch and evicted
+    least-recently-used beyond `max_sessions`.
+    """
+
+    def __init__(self, per_session: int = 200, max_sessions: int = 50_000):
+        self.per_session = per_session
+        self.max_sessions = max_sessions
+        # Per session: image ids in vote order, most recent last
+        self._sessions: OrderedDict[str, dict[int, None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, conn: sqlite3.Connection, session_id: str) -> dict[int, None]:
+        seen = self._sessions.get(session_id)
+        if seen is not None:
+            self._sessions.move_to_end(session_id)
+            return seen
+        rows = conn.execute(
+            "SELECT DISTINCT image_id FROM votes WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.per_session),
+        ).fetchall()
+        seen = dict.fromkeys(r["image_id"] for r in reversed(rows))
+        self._sessions[session_id] = seen
+        if len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return seen
+
+    def get(self, conn: sqlite3.Connection, session_id: str) -> list[int]:
+        with self._lock:
+            return list(self._session(conn, session_id))
+
+    def add(self, conn: sqlite3.Connection, session_id: str, image_id: int) -> None:
+        with self._lock:
+            seen = self._session(conn, session_id)
+            seen.pop(image_id, None)
+            seen[image_id] = None
+            if len(seen) > self.per_session:
+                del seen[next(iter(seen))]
+
+
+seen_images = SeenImages()
+
+
 def _ensure_session(session_id: str | None, response: Response) -> str:
     if not session_id:
         session_id = uuid.uuid4().hex
@@ -108,33 +251,24 @@ def _ensure_session(session_id: str | None, response: Response) -> str:
 
 
 @app.get("/api/next")
-def next_image(response: Response, session_id: str | None = Cookie(default=None)):
+def next_image(
+    response: Response,
+    session_id: str | None = Cookie(default=None),
+    conn: sqlite3.Connection = Depends(get_db_dep),
+):
     session_id = _ensure_session(session_id, response)
-    conn = get_db()
-
-    # Weighted random: use score to bias selection toward better images.
-    # Fetch all image ids + scores, pick weighted-random, excluding recently
-    # seen by this session (last 50).
-    seen_rows = conn.execute(
-        "SELECT DISTINCT image_id FROM votes WHERE session_id = ? ORDER BY id DESC LIMIT 200",
-        (session_id,),
-    ).fetchall()
-    seen_ids = {r["image_id"] for r in seen_rows}
-
-    rows = conn.execute("SELECT id, filename, username, tweet_id, title, score, votes_up, votes_down, votes_super FROM images").fetchall()
-    conn.close()
 
-    candidates = [r for r in rows if r["id"] not in seen_ids]
-    if not candidates:
+    # Weighted random: use score to bias selection toward better images,
+    # excluding the last 200 seen by this session. Sampling happens in SQLite
+    # so only the chosen row is fetched.
+    seen_ids = seen_images.get(conn, session_id)
+    chosen = conn.execute(_NEXT_UNSEEN_SQL, (json.dumps(seen_ids),)).fetchone()
+    if chosen is None:
         # They've seen everything — reset and show all
-        candidates = list(rows)
-    if not candidates:
+        chosen = conn.execute(_NEXT_ANY_SQL).fetchone()
+    if chosen is None:
         return {"done": True}
 
-    min_score = min(r["score"] for r in candidates)
-    weights = [r["score"] - min_score + 100 for r in candidates]
-    chosen = random.choices(candidates, weights=weights, k=1)[0]
-
     return {
         "id": chosen["id"],
         "filename": chosen["filename"],
@@ -144,7 +278,7 @@ def next_image(response: Response, session_id: str | None = Cookie(default=None)
         "score": round(chosen["score"]),
         "votes_up": chosen["votes_up"],
         "votes_down": chosen["votes_down"],
-        "remaining": len(candidates),
+        "remaining": chosen["remaining"],
     }
 
 
@@ -157,8 +291,154 @@ class VoteRequest(BaseModel):
     direction: str  # "left" (no), "right" (yes), or "super" (superlike)
 
 
+def _new_score(score: float, direction: str) -> float:
+    """Elo update against a fixed 1500-rated opponent; superlikes count double."""
+    expected = 1 / (1 + 10 ** ((1500 - score) / 400))
+    if direction == "super":
+        actual = 1.0
+        k = ELO_K * 2
+    elif direction == "right":
+        actual = 1.0
+        k = ELO_K
+    else:
+        actual = 0.0
+        k = ELO_K
+    return score + k * (actual - expected)
+
+
+# Retries for a failed batch write, with exponential backoff from
+# FLUSH_RETRY_DELAY seconds (0.1 + 0.2 + ... ~3 s in total)
+FLUSH_RETRIES = 5
+FLUSH_RETRY_DELAY = 0.1
+
+
+class VoteWriter:
+    """Buffers votes and writes them to SQLite in batches on a background thread.
+
+    Scores are computed at submit time from an in-memory copy (seeded from the
+    DB on first use of each image), so handlers return without waiting for a
+    commit. The thread flushes up to batch_size votes, or whatever arrived
+    within max_delay seconds, in one transaction.
+    """
+
+    def __init__(self, batch_size: int = 256, max_delay: float = 0.1):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue: queue.Queue[tuple[int, str, str, float] | None] = queue.Queue()
+        self._scores: dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, conn: sqlite3.Connection, image_id: int, direction: str, session_id: str) -> float | None:
+        """Queue a vote and return the image's new score, or None if the image doesn't exist."""
+        with self._lock:
+            score = self._scores.get(image_id)
+            if score is None:
+                row = conn.execute("SELECT score FROM images WHERE id = ?", (image_id,)).fetchone()
+                if row is None:
+                    return None
+                score = row["score"]
+            self._scores[image_id] = score = _new_score(score, direction)
+            self._queue.put((image_id, direction, session_id, score))
+        return score
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="vote-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Flush everything queued so far and stop the thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch: list[tuple[int, str, str, float]]) -> None:
+        """Flush batch, retrying transient errors (e.g. "database is locked").
+
+        If it still fails the votes are lost; their images are dropped from
+        the score cache so the next vote reloads what the DB actually holds
+        instead of building on scores that were never written.
+        """
+        for attempt in range(FLUSH_RETRIES + 1):
+            try:
+                self._flush(batch)
+                return
+            except sqlite3.Error as exc:
+                error = exc
+                # Only lock/busy-style errors can clear up on their own
+                if not isinstance(exc, sqlite3.OperationalError) or attempt == FLUSH_RETRIES:
+                    break
+                logger.warning("Vote flush failed (%s), retrying", exc)
+                time.sleep(FLUSH_RETRY_DELAY * 2**attempt)
+        logger.error("Failed to write %d votes", len(batch), exc_info=error)
+        with self._lock:
+            for image_id, *_ in batch:
+                self._scores.pop(image_id, None)
+
+    @staticmethod
+    def _flush(batch: list[tuple[int, str, str, float]]) -> None:
+        # Per image: final score and vote-count increments for the whole batch
+        totals: dict[int, list] = {}
+        for image_id, direction, _, score in batch:
+            t = totals.setdefault(image_id, [0.0, 0, 0, 0])
+            t[0] = score
+            if direction == "left":
+                t[2] += 1
+            else:
+                t[1] += 1
+                if direction == "super":
+                    t[3] += 1
+        conn = get_db()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO votes (image_id, direction, session_id) VALUES (?, ?, ?)",
+                    [(image_id, direction, session_id) for image_id, direction, session_id, _ in batch],
+                )
+                conn.executemany(
+                    """UPDATE images SET score = ?, votes_up = votes_up + ?,
+                           votes_down = votes_down + ?, votes_super = votes_super + ?
+                       WHERE id = ?""",
+                    [(*t, image_id) for image_id, t in totals.items()],
+                )
+        finally:
+            release_db(conn)
+
+
+vote_writer = VoteWriter()
+
+
 @app.post("/api/vote")
-def cast_vote(vote: VoteRequest, request: Request, response: Response, session_id: str | None = Cookie(default=None)):
+def cast_vote(
+    vote: VoteRequest,
+    request: Request,
+    response: Response,
+    session_id: str | None = Cookie(default=None),
+    conn: sqlite3.Connection = Depends(get_db_dep),
+):
     session_id = _ensure_session(session_id, response)
 
     if vote.direction not in ("left", "right", "super"):
@@ -168,44 +448,9 @@ def cast_vote(vote: VoteRequest, request: Request, response: Response, session_i
     if not vote_limiter.is_allowed(client_ip):
         return Response(status_code=429)
 
-    conn = get_db()
-
-    conn.execute(
-        "INSERT INTO votes (image_id, direction, session_id) VALUES (?, ?, ?)",
-        (vote.image_id, vote.direction, session_id),
-    )
-
-    img = conn.execute("SELECT score, votes_up, votes_down FROM images WHERE id = ?", (vote.image_id,)).fetchone()
-    if img:
-        expected = 1 / (1 + 10 ** ((1500 - img["score"]) / 400))
-        if vote.direction == "super":
-            actual = 1.0
-            k = ELO_K * 2
-        elif vote.direction == "right":
-            actual = 1.0
-            k = ELO_K
-        else:
-            actual = 0.0
-            k = ELO_K
-        new_score = img["score"] + k * (actual - expected)
-
-        if vote.direction == "super":
-            conn.execute(
-                "UPDATE images SET score = ?, votes_up = votes_up + 1, votes_super = votes_super + 1 WHERE id = ?",
-                (new_score, vote.image_id),
-            )
-        elif vote.direction == "right":
-            conn.execute(
-                "UPDATE images SET score = ?, votes_up = votes_up + 1 WHERE id = ?",
-                (new_score, vote.image_id),
-            )
-        else:
-            conn.execute(
-                "UPDATE images SET score = ?, votes_down = votes_down + 1 WHERE id = ?",
-                (new_score, vote.image_id),
-            )
-    conn.commit()
-    conn.close()
+    if vote_writer.submit(conn, vote.image_id, vote.direction, session_id) is None:
+        return Response(status_code=404)
+    seen_images.add(conn, session_id, vote.image_id)
     return {"ok": True}
 
 
@@ -214,8 +459,10 @@ def cast_vote(vote: VoteRequest, request: Request, response: Response, session_i
 # ---------------------------------------------------------------------------
 
 @app.get("/api/leaderboard")
-def leaderboard(limit: int = Query(default=50, le=200)):
-    conn = get_db()
+def leaderboard(
+    limit: int = Query(default=50, le=200),
+    conn: sqlite3.Connection = Depends(get_db_dep),
+):
     rows = conn.execute(
         """SELECT id, filename, username, tweet_id, title, score, votes_up, votes_down, votes_super
            FROM images
@@ -224,24 +471,20 @@ def leaderboard(limit: int = Query(default=50, le=200)):
            LIMIT ?""",
         (limit,),
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
 @app.get("/api/stats")
-def stats():
-    conn = get_db()
-    total_images = conn.execute("SELECT COUNT(*) as c FROM images").fetchone()["c"]
-    total_votes = conn.execute("SELECT COUNT(*) as c FROM votes").fetchone()["c"]
-    total_sessions = conn.execute("SELECT COUNT(DISTINCT session_id) as c FROM votes").fetchone()["c"]
-    voted_images = conn.execute("SELECT COUNT(*) as c FROM images WHERE votes_up + votes_down > 0").fetchone()["c"]
-    conn.close()
-    return {
-        "total_images": total_images,
-        "total_votes": total_votes,
-        "total_sessions": total_sessions,
-        "voted_images": voted_images,
-    }
+def stats(conn: sqlite3.Connection = Depends(get_db_dep)):
+    # One statement; each count still picks its own index (voted_images uses
+    # the partial idx_images_voted_score, sessions idx_votes_session)
+    row = conn.execute(
+        """SELECT (SELECT COUNT(*) FROM images) AS total_images,
+                  (SELECT COUNT(*) FROM votes) AS total_votes,
+                  (SELECT COUNT(DISTINCT session_id) FROM votes) AS total_sessions,
+                  (SELECT COUNT(*) FROM images WHERE votes_up + votes_down > 0) AS voted_images"""
+    ).fetchone()
+    return dict(row)
 
 
 # ---------------------------------------------------------------------------
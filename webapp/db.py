@@ -1,20 +1,90 @@
 """SQLite database setup and helpers."""
 
+import itertools
+import queue
+import random
 import sqlite3
+from collections.abc import Iterator
 from pathlib import Path
 
 _VOLUME_PATH = Path("/data/wallpeepo.db")
 DB_PATH = _VOLUME_PATH if _VOLUME_PATH.parent.exists() else Path(__file__).resolve().parent / "wallpeepo.db"
 
+# Idle connections kept for reuse. The deploy is a single worker on a 512 MB
+# VM, so keep only a handful; bursts beyond this get fresh connections that
+# are closed on release rather than kept idle.
+POOL_SIZE = 4
 
-def get_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(str(DB_PATH))
+_pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+
+
+def _sample_key(weight: float) -> float:
+    """Weighted-sampling key: the row with the smallest key is a draw proportional to weight."""
+    return random.expovariate(1.0) / weight
+
+
+def _connect() -> sqlite3.Connection:
+    # Dependencies and handlers may run on different threadpool threads.
+    # Pooled connections live long, so give their statement cache headroom.
+    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA foreign_keys=ON")
+    # WAL makes NORMAL safe against corruption; only the last commits can be lost on power failure
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    # Page cache is private per connection; 8 MiB each keeps the pool's
+    # worst case small (mmap pages are shared through the OS page cache)
+    conn.execute("PRAGMA cache_size=-8192")
+    conn.create_function("sample_key", 1, _sample_key)
     return conn
 
 
+def get_db() -> sqlite3.Connection:
+    """Take a configured connection from the pool; hand it back with release_db()."""
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+
+def _close(conn: sqlite3.Connection) -> None:
+    # SQLite's recommended hook: refresh planner stats for tables whose
+    # queries on this connection would benefit, then close
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+
+def release_db(conn: sqlite3.Connection) -> None:
+    """Return a connection from get_db() to the pool, discarding any open transaction."""
+    if conn.in_transaction:
+        conn.rollback()
+    if _pool.qsize() < POOL_SIZE:
+        _pool.put(conn)
+    else:
+        _close(conn)
+
+
+def close_pool() -> None:
+    """Close every idle pooled connection; call on shutdown."""
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            return
+        _close(conn)
+
+
+def get_db_dep() -> Iterator[sqlite3.Connection]:
+    """FastAPI dependency: a pooled connection for the duration of one request."""
+    conn = get_db()
+    try:
+        yield conn
+    finally:
+        release_db(conn)
+
+
 def init_db():
     conn = get_db()
     conn.executescript("""
@@ -42,6 +112,14 @@ def init_db():
         CREATE INDEX IF NOT EXISTS idx_votes_image ON votes(image_id);
         CREATE INDEX IF NOT EXISTS idx_votes_session ON votes(session_id);
         CREATE INDEX IF NOT EXISTS idx_images_score ON images(score DESC);
+        -- Leaderboard: voted images by score, without scanning unvoted ones
+        CREATE INDEX IF NOT EXISTS idx_images_voted_score ON images(score DESC)
+            WHERE votes_up + votes_down > 0;
+
+        CREATE TABLE IF NOT EXISTS meta_kv (
+            key         TEXT PRIMARY KEY,
+            value       TEXT
+        );
     """)
     # Migrate older DBs that lack votes_super
     try:
@@ -65,25 +143,44 @@ def init_db():
             DROP TABLE votes_old;
         """)
     conn.commit()
-    conn.close()
+    # Give the planner statistics for the votes/images indexes; cheap at
+    # this size and run once per process
+    conn.execute("ANALYZE")
+    release_db(conn)
+
+
+def get_meta(key: str) -> str | None:
+    conn = get_db()
+    row = conn.execute("SELECT value FROM meta_kv WHERE key = ?", (key,)).fetchone()
+    release_db(conn)
+    return row["value"] if row else None
+
+
+def set_meta(key: str, value: str):
+    conn = get_db()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta_kv (key, value) VALUES (?, ?)", (key, value))
+    release_db(conn)
+
+
+_INSERT_IMAGE_SQL = """INSERT OR IGNORE INTO images (filename, username, date, tweet_id, title)
+                        VALUES (?, ?, ?, ?, ?)"""
+# Rows per transaction; keeps each commit's WAL growth bounded on big imports
+METADATA_BATCH_SIZE = 5000
 
 
 def load_metadata_into_db(metadata: dict):
     """Bulk-insert images from metadata.json, skipping existing."""
+    rows = (
+        (filename, info["username"], info.get("date"), info.get("tweet_id"), info.get("title"))
+        for filename, info in metadata.items()
+    )
     conn = get_db()
-    cursor = conn.cursor()
     inserted = 0
-    for filename, info in metadata.items():
-        try:
-            cursor.execute(
-                """INSERT OR IGNORE INTO images (filename, username, date, tweet_id, title)
-                   VALUES (?, ?, ?, ?, ?)""",
-                (filename, info["username"], info.get("date"), info.get("tweet_id"), info.get("title")),
-            )
-            if cursor.rowcount:
-                inserted += 1
-        except sqlite3.IntegrityError:
-            pass
-    conn.commit()
-    conn.close()
+    try:
+        while batch := list(itertools.islice(rows, METADATA_BATCH_SIZE)):
+            with conn:
+                inserted += conn.executemany(_INSERT_IMAGE_SQL, batch).rowcount
+    finally:
+        release_db(conn)
     return inserted
@@ -10,59 +10,151 @@ import argparse
 import json
 import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
 from PIL import Image
 import imagehash
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 ART_DIR = Path(__file__).resolve().parent.parent / "art"
 METADATA_PATH = ART_DIR / "metadata.json"
+# Written next to the images: {filename: [mtime_ns, size, HASH_VERSION, phash hex]}
+PHASH_CACHE_NAME = "phash_cache.json"
+# Bumped whenever _hash_one can produce different bits for the same file
+HASH_VERSION = 2
+
+
+def _hash_one(filepath: Path) -> tuple[imagehash.ImageHash | None, str | None]:
+    """phash of one image, or the error; runs in a worker process."""
+    try:
+        with Image.open(filepath) as img:
+            # phash only looks at 32x32 grayscale; let libjpeg decode at
+            # 1/2..1/8 scale instead of full resolution (no-op for non-JPEG)
+            img.draft("L", (64, 64))
+            return imagehash.phash(img), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _load_phash_cache(path: Path) -> dict[str, list]:
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        return {}
+    try:
+        cache = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError:
+        cache = None
+    if not isinstance(cache, dict):
+        print(f"  ignoring unreadable {path.name}")
+        return {}
+    return cache
 
 
 def phash_images(art_dir: Path, metadata: dict) -> dict[str, imagehash.ImageHash]:
+    """phash every image in metadata that exists in art_dir.
+
+    Hashes are cached in PHASH_CACHE_NAME keyed on (mtime_ns, size,
+    HASH_VERSION), so only new or changed files are decoded again.
+    """
+    cache_path = art_dir / PHASH_CACHE_NAME
+    cache = _load_phash_cache(cache_path)
+    new_cache: dict[str, list] = {}
     hashes = {}
     total = len(metadata)
+    jobs = []
     for i, filename in enumerate(metadata, 1):
-        filepath = art_dir / filename
-        if not filepath.exists():
-            continue
         try:
-            img = Image.open(filepath)
-            hashes[filename] = imagehash.phash(img)
-        except Exception as e:
-            print(f"  [{i}/{total}] skip {filename}: {e}")
+            st = (art_dir / filename).stat()
+        except OSError:
             continue
-        if i % 500 == 0:
-            print(f"  [{i}/{total}] hashed...")
-    return hashes
+        key = [st.st_mtime_ns, st.st_size, HASH_VERSION]
+        cached = cache.get(filename)
+        h = None
+        if isinstance(cached, list) and len(cached) == 4 and cached[:3] == key:
+            try:
+                h = imagehash.hex_to_hash(cached[3])
+            except (TypeError, ValueError):
+                pass
+            # Damaged or hand-edited entry: treat as a miss and hash again
+            if h is not None and h.hash.shape != (8, 8):
+                h = None
+        if h is not None:
+            hashes[filename] = h
+            new_cache[filename] = cached
+        else:
+            jobs.append((i, filename, art_dir / filename, key))
+    if hashes:
+        print(f"  {len(hashes)} hashes reused from {PHASH_CACHE_NAME}")
+
+    if jobs:
+        # Decode + DCT is CPU-bound; hash across all cores
+        with ProcessPoolExecutor() as pool:
+            results = pool.map(_hash_one, [path for _, _, path, _ in jobs], chunksize=32)
+            for done, ((i, filename, _, key), (h, err)) in enumerate(zip(jobs, results), 1):
+                if err is not None:
+                    print(f"  [{i}/{total}] skip {filename}: {err}")
+                else:
+                    hashes[filename] = h
+                    new_cache[filename] = key + [str(h)]
+                if done % 500 == 0:
+                    print(f"  [{done}/{len(jobs)}] hashed...")
+
+    if new_cache != cache:
+        data = orjson.dumps(new_cache) if orjson is not None else json.dumps(new_cache).encode()
+        tmp = cache_path.with_name(cache_path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, cache_path)
+    # Same order as metadata, whether hashed now or taken from the cache
+    return {f: hashes[f] for f in metadata if f in hashes}
+
+
+if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+    def _popcount(x: np.ndarray) -> np.ndarray:
+        return _POPCOUNT16[x.view(np.uint16).reshape(-1, 4)].sum(axis=1, dtype=np.uint8)
 
 
 def find_duplicate_groups(
     hashes: dict[str, imagehash.ImageHash], threshold: int = 6
 ) -> list[list[str]]:
     filenames = list(hashes.keys())
-    visited = set()
+    # str(ImageHash) is the hex of its bits, so XOR + popcount on these
+    # (64-bit, for the default 8x8 phash) words equals ImageHash subtraction
+    values = np.array([int(str(h), 16) for h in hashes.values()], dtype=np.uint64)
+    unvisited = np.ones(len(filenames), dtype=bool)
     groups = []
 
     for i, f1 in enumerate(filenames):
-        if f1 in visited:
+        if not unvisited[i]:
             continue
-        group = [f1]
-        for f2 in filenames[i + 1 :]:
-            if f2 in visited:
-                continue
-            if hashes[f1] - hashes[f2] <= threshold:
-                group.append(f2)
-                visited.add(f2)
-        if len(group) > 1:
-            groups.append(group)
-            visited.add(f1)
+        # Distances from f1 to every later file in one vectorized pass
+        close = _popcount(values[i + 1 :] ^ values[i]) <= threshold
+        matches = np.flatnonzero(close & unvisited[i + 1 :]) + (i + 1)
+        if matches.size:
+            groups.append([f1] + [filenames[j] for j in matches])
+            unvisited[matches] = False
+            unvisited[i] = False
 
     return groups
 
 
-def pick_best(group: list[str], art_dir: Path) -> str:
-    """Keep the largest file (proxy for highest resolution)."""
+def pick_best(group: list[str], art_dir: Path, sizes: dict[str, int] | None = None) -> str:
+    """Keep the largest file (proxy for highest resolution).
+
+    sizes, if given, maps filename -> size in bytes and saves a stat per file.
+    """
+    if sizes is not None:
+        return max(group, key=sizes.__getitem__)
     return max(group, key=lambda f: (art_dir / f).stat().st_size)
 
 
@@ -70,39 +162,7 @@ def generate_review_html(groups: list[list[str]], hashes: dict, art_dir: Path, m
     """Generate an HTML page showing duplicate groups side-by-side for review."""
     out_path = Path(__file__).resolve().parent / "dedup_review.html"
 
-    tiles_html = []
-    for gi, group in enumerate(groups, 1):
-        best = pick_best(group, art_dir)
-        cards = []
-        for filename in group:
-            is_keep = filename == best
-            info = metadata.get(filename, {})
-            size_kb = (art_dir / filename).stat().st_size // 1024
-            try:
-                w, h = Image.open(art_dir / filename).size
-                dims = f"{w}×{h}"
-            except Exception:
-                dims = "?"
-            dist = hashes[best] - hashes[filename] if filename != best else 0
-            badge = f'<span class="badge keep">KEEP</span>' if is_keep else f'<span class="badge remove">REMOVE</span>'
-            cards.append(f'''
-                <div class="card {'keep-card' if is_keep else 'remove-card'}">
-                    {badge}
-                    <img src="../art/{filename}" loading="lazy">
-                    <div class="meta">
-                        <b>@{info.get("username", "?")}</b><br>
-                        <span class="dim">{filename}</span><br>
-                        <span class="dim">{dims} · {size_kb} KB · dist {dist}</span>
-                    </div>
-                </div>''')
-
-        tiles_html.append(f'''
-            <div class="group">
-                <div class="group-header">Group {gi} — {len(group)} images</div>
-                <div class="group-images">{"".join(cards)}</div>
-            </div>''')
-
-    html = f'''<!DOCTYPE html>
+    head = f'''<!DOCTYPE html>
 <html lang="en"><head>
 <meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
 <title>Dedup Review — {len(groups)} groups</title>
@@ -127,13 +187,52 @@ def generate_review_html(groups: list[list[str]], hashes: dict, art_dir: Path, m
 </head><body>
 <h1>Dedup Review</h1>
 <p class="summary">{len(groups)} duplicate groups · {sum(len(g) - 1 for g in groups)} images would be removed · green = keep, red = remove</p>
-{"".join(tiles_html)}
-</body></html>'''
+'''
 
-    out_path.write_text(html)
+    # Written group by group rather than assembled into one string
+    with out_path.open("w") as f:
+        f.write(head)
+        for gi, group in enumerate(groups, 1):
+            # One stat per file, shared by pick_best and the cards
+            sizes = {filename: (art_dir / filename).stat().st_size for filename in group}
+            best = pick_best(group, art_dir, sizes)
+            f.write(f'''
+            <div class="group">
+                <div class="group-header">Group {gi} — {len(group)} images</div>
+                <div class="group-images">''')
+            for filename in group:
+                is_keep = filename == best
+                info = metadata.get(filename, {})
+                size_kb = sizes[filename] // 1024
+                try:
+                    # Image.open only parses the header; size needs no decode
+                    with Image.open(art_dir / filename) as img:
+                        w, h = img.size
+                    dims = f"{w}×{h}"
+                except Exception:
+                    dims = "?"
+                dist = hashes[best] - hashes[filename] if filename != best else 0
+                badge = '<span class="badge keep">KEEP</span>' if is_keep else '<span class="badge remove">REMOVE</span>'
+                f.write(f'''
+                <div class="card {'keep-card' if is_keep else 'remove-card'}">
+                    {badge}
+                    <img src="../art/{filename}" loading="lazy">
+                    <div class="meta">
+                        <b>@{info.get("username", "?")}</b><br>
+                        <span class="dim">{filename}</span><br>
+                        <span class="dim">{dims} · {size_kb} KB · dist {dist}</span>
+                    </div>
+                </div>''')
+            f.write('''</div>
+            </div>''')
+        f.write("\n</body></html>")
     return out_path
 
 
+def _unlink(filename: str) -> None:
+    (ART_DIR / filename).unlink(missing_ok=True)
+
+
 def run_dedup(threshold: int = 6, dry_run: bool = False, review: bool = False):
     with open(METADATA_PATH) as f:
         metadata = json.load(f)
@@ -169,12 +268,18 @@ def run_dedup(threshold: int = 6, dry_run: bool = False, review: bool = False):
         print(f"\n[dry run] Would remove {len(to_remove)} files.")
         return
 
+    # Each unlink is a round-trip on a network volume (/data); overlap them
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for i, _ in enumerate(pool.map(_unlink, to_remove), 1):
+            if i % 500 == 0:
+                print(f"  [{i}/{len(to_remove)}] removed...")
     for filename in to_remove:
-        (ART_DIR / filename).unlink(missing_ok=True)
         del metadata[filename]
 
-    with open(METADATA_PATH, "w") as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        METADATA_PATH.write_bytes(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    else:
+        METADATA_PATH.write_text(json.dumps(metadata, indent=2, ensure_ascii=False), encoding="utf-8")
 
     print(f"\nRemoved {len(to_remove)} duplicates. metadata.json updated.")
 